@@ -0,0 +1,157 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : approx.py
+# Time       ：2025/7/23 11:18
+# Author     ：aigonna
+"""
+整表加载时的近似分析模式（data_statistics_analysis、outlier_detection的approximate参数，或APPROXIMATE_ANALYSIS=1）
+
+精确模式中最慢的是全表duplicated()、全列分位数和高基数列的nunique/value_counts，近似模式改为：
+    - 分位数：在APPROX_SAMPLE_ROWS行的均匀样本上计算，秩误差按DKW不等式给出（99%置信度）
+    - nunique：非category列用HyperLogLog；category列按编码精确计算（本身很快）
+    - top_values：非category列在样本上统计后按比例放大
+    - 重复行：sketches.DuplicateEstimator对整行哈希计数，超过DUPLICATE_HASH_LIMIT时按哈希抽样
+计数、均值、标准差、最小值、最大值、空值数、相关系数和异常值个数仍然精确。
+结果中的approximations列出每个近似字段及其误差界；行数不超过样本大小时分位数和top_values为精确值。
+"""
+import os
+import numpy as np
+import pandas as pd
+from dataset import categorical_columns
+from sketches import HyperLogLog, DuplicateEstimator, hash_values, hash_rows
+
+# 设置为1时所有支持的工具默认使用近似模式
+APPROXIMATE_ANALYSIS = os.getenv("APPROXIMATE_ANALYSIS", "0") == "1"
+# 分位数和高基数列top_values使用的样本行数
+APPROX_SAMPLE_ROWS = int(os.getenv("APPROX_SAMPLE_ROWS", "200000"))
+_CONFIDENCE = 0.99
+
+
+def use_approximate(requested: bool = False) -> bool:
+    return bool(requested) or APPROXIMATE_ANALYSIS
+
+
+def _sample_positions(n: int) -> np.ndarray:
+    """固定种子的有放回均匀抽样，行数不超过样本大小时返回None表示使用全部行"""
+    if n <= APPROX_SAMPLE_ROWS:
+        return None
+    return np.sort(np.random.default_rng(0).integers(0, n, APPROX_SAMPLE_ROWS))
+
+
+def quantile_rank_error(sample_size: int) -> float:
+    """DKW不等式：样本经验分布与总体分布的最大秩误差（99%置信度）"""
+    return round(float(np.sqrt(np.log(2 / (1 - _CONFIDENCE)) / (2 * sample_size))), 4)
+
+
+def _quantiles(frame: pd.DataFrame, positions) -> pd.DataFrame:
+    sample = frame if positions is None else frame.iloc[positions]
+    return sample.quantile([0.25, 0.5, 0.75])
+
+
+def data_statistics(df: pd.DataFrame) -> dict:
+    """近似计算data_statistics_analysis的统计结果"""
+    positions = _sample_positions(len(df))
+    approximations = {}
+
+    numeric = df.select_dtypes(include=[np.number])
+    dates = df.select_dtypes(include=['datetime'])
+    numerical_statistics = {}
+    for frame, with_std in ((numeric, True), (dates, False)):
+        if not len(frame.columns):
+            continue
+        stats = frame.agg(['count', 'mean', 'min', 'max'])
+        stats.loc['std'] = frame.std() if with_std else np.nan
+        quantiles = _quantiles(frame, positions)
+        quantiles.index = ['25%', '50%', '75%']
+        stats = pd.concat([stats, quantiles]).loc[['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']]
+        numerical_statistics.update(stats.to_dict())
+    if positions is not None and numerical_statistics:
+        approximations["numerical_statistics.quantiles"] = {
+            "method": "uniform sample", "sample_rows": len(positions), "rank_error": quantile_rank_error(len(positions))}
+
+    null_counts = df.isnull().sum()
+    categorical_statistics = {}
+    for col in categorical_columns(df):
+        column = df[col]
+        if isinstance(column.dtype, pd.CategoricalDtype) or positions is None:
+            value_counts = column.value_counts()
+            unique_count, top_values = int((value_counts > 0).sum()), value_counts.head(10).to_dict()
+        else:
+            hll = HyperLogLog()
+            hll.update(hash_values(column))
+            sample = column.iloc[positions]
+            scale = (len(column) - null_counts[col]) / max(int(sample.notna().sum()), 1)
+            unique_count = hll.estimate()
+            top_values = {key: int(round(count * scale)) for key, count in sample.value_counts().head(10).items()}
+            approximations[f"categorical_statistics.{col}"] = {
+                "method": "HyperLogLog + uniform sample", "unique_count_relative_error": hll.relative_error(),
+                "top_values_sample_rows": len(positions)}
+        categorical_statistics[col] = {"unique_count": unique_count, "top_values": top_values, "null_count": null_counts[col]}
+
+    duplicates = DuplicateEstimator()
+    duplicates.update(hash_rows(df))
+    duplicate_result = duplicates.result()
+    duplicate_rows = duplicate_result.pop("duplicate_rows")
+    approximations["data_quality.duplicate_rows"] = dict({"method": "hashed rows"}, **duplicate_result)
+
+    return {
+        "numerical_statistics": numerical_statistics,
+        "categorical_statistics": categorical_statistics,
+        "correlation_matrix": numeric.corr().to_dict(),
+        "data_quality": {
+            "total_rows": len(df),
+            "duplicate_rows": duplicate_rows,
+            "missing_data_summary": null_counts.to_dict(),
+            "missing_percentage": (null_counts / len(df) * 100).to_dict()
+        },
+        "engine": "approximate",
+        "approximations": approximations
+    }
+
+
+def outlier_summary(df: pd.DataFrame, column_name: str, method: str = "iqr") -> dict:
+    """近似计算outlier_detection的结果：四分位数和中位数来自样本，异常值按边界精确计数"""
+    data = df[column_name].dropna()
+    positions = _sample_positions(len(data))
+    q1, median, q3 = _quantiles(data.to_frame(), positions)[column_name].tolist()
+    mean, std = data.mean(), data.std()
+
+    outliers_info = {}
+    if method in ["iqr", "both"]:
+        iqr = q3 - q1
+        lower_bound, upper_bound = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+        iqr_outliers = data[(data < lower_bound) | (data > upper_bound)]
+        outliers_info["iqr_method"] = {
+            "lower_bound": lower_bound,
+            "upper_bound": upper_bound,
+            "outliers_count": len(iqr_outliers),
+            "outliers_percentage": (len(iqr_outliers) / len(data)) * 100,
+            "outlier_values": iqr_outliers.tolist()
+        }
+    if method in ["zscore", "both"]:
+        zscore_outliers = data[((data - mean) / std).abs() > 3]
+        outliers_info["zscore_method"] = {
+            "threshold": 3,
+            "outliers_count": len(zscore_outliers),
+            "outliers_percentage": (len(zscore_outliers) / len(data)) * 100,
+            "outlier_values": zscore_outliers.tolist()
+        }
+
+    approximations = {}
+    if positions is not None:
+        approximations["quartiles_and_median"] = {
+            "method": "uniform sample", "sample_rows": len(positions), "rank_error": quantile_rank_error(len(positions))}
+    return {
+        "column_analyzed": column_name,
+        "total_values": len(data),
+        "data_statistics": {
+            "mean": mean,
+            "median": median,
+            "std": std,
+            "min": data.min(),
+            "max": data.max()
+        },
+        "outlier_detection_results": outliers_info,
+        "engine": "approximate",
+        "approximations": approximations
+    }
@@ -0,0 +1,146 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : artifacts.py
+# Time       ：2025/7/21 15:36
+# Author     ：aigonna
+"""
+数据集派生结果的记忆化存储
+
+describe、相关系数矩阵、单列value_counts、分组聚合、重复行数等结果由多个工具共用
+（data_statistics_analysis、correlation_analysis、category_analysis以及heatmap图表），
+以数据集版本（dataset_key：路径、修改时间、大小）为键，每个结果只计算一次：
+    - 进程内字典：同一次运行中的工具直接复用
+    - 磁盘pickle：写在DATASET_CACHE_DIR下，与Feather旁路文件同名的目录中，跨运行、跨进程（图表渲染进程）复用
+文件变化后版本改变，旧结果自然失效。返回的是共享对象，调用方不应原地修改。
+"""
+import os
+import json
+import pickle
+import hashlib
+import threading
+import pandas as pd
+from loguru import logger
+from dataset import DATASET_SIDECAR, dataset_key, load_dataframe, _sidecar_path
+
+# 设置ARTIFACT_CACHE=0关闭记忆化
+ARTIFACT_CACHE = os.getenv("ARTIFACT_CACHE", "1") != "0"
+
+_artifacts = {}  # (dataset_key, 结果名) -> 结果
+_artifacts_lock = threading.Lock()
+_compute_locks = {}
+
+
+def _artifact_name(kind: str, params: dict) -> str:
+    """结果名：类型加参数摘要，参数中包含pandas版本，避免不同版本之间读取pickle"""
+    raw = json.dumps(dict(params, pandas=pd.__version__), sort_keys=True, ensure_ascii=False, default=str)
+    return f"{kind}_{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _disk_path(key: tuple, name: str) -> str:
+    return os.path.join(f"{os.path.splitext(_sidecar_path(key))[0]}.artifacts", f"{name}.pkl")
+
+
+def _read_disk(path: str):
+    if not (DATASET_SIDECAR and os.path.exists(path)):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"读取派生结果缓存失败，重新计算: {path}, {e}")
+        return None
+
+
+def _write_disk(path: str, value):
+    if not DATASET_SIDECAR:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"写入派生结果缓存失败: {path}, {e}")
+
+
+def memoize(file_path: str, kind: str, compute, **params):
+    """
+    返回数据集的派生结果，同一数据集版本和参数只计算一次
+    :param file_path: 数据文件路径
+    :param kind: 结果类型，如describe、corr
+    :param compute: 未命中时调用compute(df)计算结果
+    :param params: 影响结果的参数
+    :return: 结果（共享对象）
+    """
+    if not ARTIFACT_CACHE:
+        return compute(load_dataframe(file_path))
+    key = dataset_key(file_path)
+    memo_key = (key, _artifact_name(kind, params))
+    with _artifacts_lock:
+        if memo_key in _artifacts:
+            return _artifacts[memo_key]
+        compute_lock = _compute_locks.setdefault(memo_key, threading.Lock())
+
+    # 多个工具并发请求同一结果时只计算一次
+    with compute_lock:
+        with _artifacts_lock:
+            if memo_key in _artifacts:
+                return _artifacts[memo_key]
+        path = _disk_path(key, memo_key[1])
+        value = _read_disk(path)
+        if value is None:
+            value = compute(load_dataframe(file_path))
+            _write_disk(path, value)
+        with _artifacts_lock:
+            _compute_locks.pop(memo_key, None)
+            # 旧版本文件的结果直接丢弃
+            for stale in [k for k in _artifacts if k[0][0] == key[0] and k[0] != key]:
+                del _artifacts[stale]
+            _artifacts[memo_key] = value
+        return value
+
+
+def describe(file_path: str) -> pd.DataFrame:
+    """数值列的describe()"""
+    return memoize(file_path, "describe", lambda df: df.describe())
+
+
+def correlation_matrix(file_path: str) -> pd.DataFrame:
+    """数值列的Pearson相关系数矩阵"""
+    import numpy as np
+    return memoize(file_path, "corr", lambda df: df.select_dtypes(include=[np.number]).corr())
+
+
+def value_counts(file_path: str, column: str) -> pd.Series:
+    """单列的完整value_counts（不含空值），len()即nunique()"""
+    return memoize(file_path, "value_counts", lambda df: df[column].value_counts(), column=column)
+
+
+def null_counts(file_path: str) -> pd.Series:
+    """各列空值数"""
+    return memoize(file_path, "null_counts", lambda df: df.isnull().sum())
+
+
+def duplicate_rows(file_path: str) -> int:
+    """完全重复的行数"""
+    return memoize(file_path, "duplicate_rows", lambda df: int(df.duplicated().sum()))
+
+
+def groupby_agg(file_path: str, by, value_column: str, aggs: tuple) -> pd.DataFrame:
+    """
+    分组聚合df.groupby(by, observed=True)[value_column].agg(aggs).reset_index()，由groupby_engine按GROUPBY_BACKEND执行
+    :param by: 分组列名或列名列表
+    :param aggs: 聚合函数名，如('sum', 'mean', 'count')
+    """
+    from groupby_engine import groupby_agg as run_groupby
+
+    aggs = list(aggs)
+    return memoize(file_path, "groupby", lambda df: run_groupby(df, by, value_column, aggs),
+                   by=by, value_column=value_column, aggs=aggs)
+
+
+def clear_artifacts():
+    """清空进程内的派生结果，磁盘上的结果保留"""
+    with _artifacts_lock:
+        _artifacts.clear()
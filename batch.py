@@ -0,0 +1,133 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : batch.py
+# Time       ：2025/7/10 15:26
+# Author     ：aigonna
+"""
+批量报告服务：读取JSONL任务文件，在一个事件循环中有界并发地运行多个报告任务
+
+任务文件每行一个JSON对象，支持以下字段：
+    - job_id: 任务id（可选，默认使用行号）
+    - user_message: 完整的用户消息
+    - csv / message: 未提供user_message时，由message和csv路径拼接出用户消息
+
+超时的任务会被取消并记为timeout，但已提交到线程池的工具调用无法中断，会继续运行到返回为止，
+期间仍占用CPU并发名额（--cpu-concurrency），随后的任务会等待该名额释放。
+
+.env中的配置在导入图和工具模块之前加载（与python -m cli batch一致）。
+用法:
+    python batch.py jobs.jsonl --results results.jsonl --concurrency 4 --llm-concurrency 8 --cpu-concurrency 4
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from loguru import logger
+from cli import add_batch_arguments
+
+
+def load_jobs(jobs_path: str) -> list:
+    """读取JSONL任务文件，跳过空行"""
+    jobs = []
+    with open(jobs_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            job.setdefault("job_id", str(line_no))
+            if not job.get("user_message"):
+                if not job.get("csv"):
+                    raise ValueError(f"第{line_no}行任务缺少user_message或csv字段")
+                message = job.get("message") or "对所给csv数据进行分析，生成分析报告"
+                job["user_message"] = f"{message}，文档路径为{job['csv']}"
+            jobs.append(job)
+    return jobs
+
+
+async def _run_job(job: dict, job_semaphore: asyncio.Semaphore, recursion_limit: int, timeout: float) -> dict:
+    from tools import create_task_folder
+    from graphs import arun
+
+    async with job_semaphore:
+        started = time.perf_counter()
+        record = {"job_id": job["job_id"], "user_message": job["user_message"], "status": "ok",
+                  "started_at": datetime.now().isoformat(timespec='seconds')}
+        # 预先创建任务文件夹，任务失败时也能给出输出路径
+        folder_result = create_task_folder.invoke({"user_message": job["user_message"]})
+        record["task_folder"] = folder_result.get("task_folder", "")
+        try:
+            final_state = await asyncio.wait_for(
+                arun(job["user_message"], recursion_limit=recursion_limit, task_folder=record["task_folder"]),
+                timeout=timeout)
+            record["final_report_chars"] = len(final_state.get("final_report") or "")
+            record["steps"] = len((final_state.get("plan") or {}).get("steps") or [])
+        except asyncio.TimeoutError:
+            record["status"] = "timeout"
+            record["error"] = f"Job exceeded {timeout}s"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["finished_at"] = datetime.now().isoformat(timespec='seconds')
+        record["duration_seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"任务 {record['job_id']} 结束: {record['status']}，耗时 {record['duration_seconds']}s")
+        return record
+
+
+async def run_batch(jobs: list, results_path: str, concurrency: int = 4, llm_concurrency: int = None,
+                    cpu_concurrency: int = None, recursion_limit: int = 100, timeout: float = None) -> list:
+    """
+    并发运行一批报告任务，每完成一个任务就向结果文件追加一行JSON
+    :param jobs: load_jobs返回的任务列表
+    :param results_path: 结果JSONL文件路径
+    :param concurrency: 同时运行的任务数
+    :param llm_concurrency: 所有任务共享的LLM并发请求上限
+    :param cpu_concurrency: 所有任务共享的CPU密集工具并发上限
+    :param recursion_limit: 每个任务的LangGraph递归上限
+    :param timeout: 单个任务超时时间（秒），超时后仍在运行的工具线程会继续占用CPU并发名额直到返回
+    :return: 按完成顺序排列的任务结果
+    """
+    from nodes import set_concurrency_limits
+
+    set_concurrency_limits(llm_concurrency, cpu_concurrency)
+    job_semaphore = asyncio.Semaphore(concurrency)
+    results_dir = os.path.dirname(os.path.abspath(results_path))
+    os.makedirs(results_dir, exist_ok=True)
+
+    records = []
+    tasks = [asyncio.create_task(_run_job(job, job_semaphore, recursion_limit, timeout)) for job in jobs]
+    with open(results_path, 'a', encoding='utf-8') as f:
+        for finished in asyncio.as_completed(tasks):
+            record = await finished
+            records.append(record)
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+    return records
+
+
+def run_from_args(args: argparse.Namespace) -> int:
+    jobs = load_jobs(args.jobs)
+    logger.info(f"共 {len(jobs)} 个任务，并发 {args.concurrency}")
+    records = asyncio.run(run_batch(jobs, args.results, concurrency=args.concurrency,
+                                    llm_concurrency=args.llm_concurrency, cpu_concurrency=args.cpu_concurrency,
+                                    recursion_limit=args.recursion_limit, timeout=args.timeout))
+    failed = [record for record in records if record["status"] != "ok"]
+    logger.info(f"批处理完成：成功 {len(records) - len(failed)}，失败 {len(failed)}，结果写入 {args.results}")
+    return 1 if failed else 0
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="批量运行数据分析报告任务")
+    add_batch_arguments(parser)
+    args = parser.parse_args(argv)
+    # 先加载.env，再导入其余模块，.env中的性能配置在模块导入时读取
+    from dotenv import load_dotenv
+    load_dotenv('.env', override=True)
+    return run_from_args(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : bench_groupby.py
+# Time       ：2025/7/24 15:12
+# Author     ：aigonna
+"""
+分组聚合后端基准测试（见groupby_engine.py）
+
+对category_analysis和trend_analysis中的分组聚合，分别用pandas、partitioned（不同线程数）和duckdb（已安装时）
+执行，记录最短耗时和相对pandas的加速比，并校验结果：partitioned必须与pandas逐位相同，
+duckdb允许浮点舍入误差（rtol=1e-9）。数据集默认使用bench_tools生成的10M行合成数据。
+
+用法:
+    python benchmarks/bench_groupby.py --output output/bench/groupby.json
+    python benchmarks/bench_groupby.py --datasets 1m 10m --workers 2 4 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_tools import BASE_CSV, BENCH_DIR, SYNTHETIC_ROWS, synthetic_csv
+
+# 用例：名称 -> (分组列, 数值列, 聚合函数)；trend用例的year/month/quarter列在加载后派生
+CASES = {
+    "category:brand": ("brand", "units_sold", ["sum", "mean", "count", "std", "min", "max"]),
+    "category:body_type": ("body_type", "units_sold", ["sum", "mean", "count", "std", "min", "max"]),
+    "trend:year": (["year"], "units_sold", ["sum", "mean", "count"]),
+    "trend:year_month": (["year", "month"], "units_sold", ["sum", "mean", "count"]),
+    "trend:year_quarter": (["year", "quarter"], "units_sold", ["sum", "mean", "count"]),
+}
+
+
+def _best_of(func, repeat: int) -> tuple:
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 4), result
+
+
+def _load(file_path: str):
+    from dataset import load_dataframe
+
+    df = load_dataframe(file_path)
+    dates = df["year_month"]
+    return df.assign(year=dates.dt.year, month=dates.dt.month, quarter=dates.dt.quarter)
+
+
+def bench_dataset(dataset: str, file_path: str, workers: list, repeat: int) -> list:
+    import pandas as pd
+    import groupby_engine
+
+    df = _load(file_path)
+    backends = [("pandas", None)] + [("partitioned", n) for n in workers]
+    try:
+        import duckdb  # noqa: F401
+        backends.append(("duckdb", None))
+    except ImportError:
+        pass
+
+    records = []
+    for case, (by, value_column, aggs) in CASES.items():
+        baseline_seconds, expected = _best_of(lambda: groupby_engine.groupby_agg(df, by, value_column, aggs, "pandas"), repeat)
+        for backend, n in backends:
+            if backend == "pandas":
+                seconds, result = baseline_seconds, expected
+            else:
+                if n:
+                    groupby_engine.set_workers(n)
+                seconds, result = _best_of(lambda: groupby_engine.groupby_agg(df, by, value_column, aggs, backend), repeat)
+            try:
+                pd.testing.assert_frame_equal(result, expected, check_exact=backend != "duckdb", rtol=1e-9)
+                identical = True
+            except AssertionError:
+                identical = False
+            records.append({"dataset": dataset, "rows": len(df), "case": case, "backend": backend, "workers": n,
+                            "seconds": seconds, "speedup": round(baseline_seconds / seconds, 2) if seconds else None,
+                            "matches_pandas": identical})
+            print(f"{dataset:<6} {case:<20} {backend:<12} workers={n or '-':<3} {seconds:.4f}s "
+                  f"x{records[-1]['speedup']} {'ok' if identical else 'MISMATCH'}")
+    return records
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="分组聚合后端基准测试")
+    parser.add_argument("--datasets", nargs="+", default=["10m"], help="数据集：base、1m、10m或CSV路径")
+    parser.add_argument("--workers", nargs="+", type=int, default=sorted({2, 4, os.cpu_count() or 1}),
+                        help="partitioned后端的线程数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例的重复次数，取最短耗时")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "groupby.json"), help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    results = []
+    for dataset in args.datasets:
+        if dataset == "base":
+            file_path = BASE_CSV
+        elif dataset in SYNTHETIC_ROWS:
+            file_path = synthetic_csv(SYNTHETIC_ROWS[dataset])
+        else:
+            file_path = dataset
+        results += bench_dataset(dataset, file_path, args.workers, args.repeat)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"python": sys.version.split()[0], "cpu_count": os.cpu_count(), "repeat": args.repeat,
+                   "results": results}, f, ensure_ascii=False, indent=2)
+    return 1 if not all(record["matches_pandas"] for record in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : bench_tools.py
+# Time       ：2025/7/15 17:32
+# Author     ：aigonna
+"""
+工具与整图的端到端基准测试
+
+每个(工具, 数据集)组合在独立子进程中运行，记录：
+    - first_call_seconds: 新进程中第一次调用的耗时（包含CSV解析）
+    - warm_seconds: 同一进程中后续调用的最短耗时（数据集已在进程内缓存）
+    - peak_rss_mb / baseline_rss_mb: 子进程峰值RSS，以及导入完成、调用工具之前的RSS
+    - worker_peak_rss_mb: 子进程派生的工作进程（图表渲染进程）中的最大峰值RSS
+    - bytes_written: 工具在任务文件夹中写入的字节数
+
+数据集包括自带的汽车销量CSV（约3.9万行）以及按其分布放大的1M、10M行合成数据，
+合成数据生成一次后缓存在 output/bench/data 下。传入--transcript时，还会用LLM_REPLAY回放录制的
+LLM响应完整运行一次图（见replay.py），记录总耗时、峰值RSS和写入字节数。
+
+默认关闭跨进程/跨运行的持久缓存（图表缓存、派生结果pickle、Feather旁路文件，见UNCACHED_ENV），
+测得的是解析、聚合和渲染本身的耗时，不会被之前运行留下的缓存掩盖；传入--cached时保留这些缓存，
+单独测量缓存命中时的耗时，每条结果的caches字段记录对应的模式。
+
+用法:
+    python benchmarks/bench_tools.py --output output/bench/tools.json
+    python benchmarks/bench_tools.py --datasets base 1m --tools category_analysis create_visualization:line
+    python benchmarks/bench_tools.py --datasets base --transcript output/transcripts/sales.jsonl
+    python benchmarks/bench_tools.py --datasets base 1m --cached --output output/bench/tools_cached.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_CSV = os.path.join(REPO_ROOT, "data", "China Automobile Sales Data.csv")
+# 未传--cached时子进程使用的环境变量：关闭图表缓存、派生结果记忆化和Feather旁路文件
+UNCACHED_ENV = {"CHART_CACHE": "0", "ARTIFACT_CACHE": "0", "DATASET_SIDECAR": "0"}
+BENCH_DIR = os.path.join("output", "bench")
+SYNTHETIC_ROWS = {"1m": 1_000_000, "10m": 10_000_000}
+GENERATE_CHUNK_ROWS = 1_000_000
+
+# 基准用例：名称 -> (工具名, 参数)，file_path和task_folder由运行时填入
+CASES = {
+    "read_csv_data": ("read_csv_data", {}),
+    "data_statistics_analysis": ("data_statistics_analysis", {}),
+    "trend_analysis": ("trend_analysis", {"date_column": "year_month", "value_column": "units_sold"}),
+    "category_analysis": ("category_analysis", {"category_column": "brand", "value_column": "units_sold"}),
+    "correlation_analysis": ("correlation_analysis", {}),
+    "outlier_detection": ("outlier_detection", {"column_name": "units_sold", "method": "iqr"}),
+    "outlier_detection:zscore": ("outlier_detection", {"column_name": "units_sold", "method": "zscore"}),
+    "sql_query": ("sql_query", {"query": "SELECT brand, SUM(units_sold) AS total FROM data GROUP BY brand ORDER BY total DESC"}),
+    "create_visualization:bar": ("create_visualization", {"chart_type": "bar", "x_column": "body_type", "y_column": "units_sold", "save_name": "bar"}),
+    "create_visualization:line": ("create_visualization", {"chart_type": "line", "x_column": "year_month", "y_column": "units_sold", "save_name": "line"}),
+    "create_visualization:scatter": ("create_visualization", {"chart_type": "scatter", "x_column": "low_price", "y_column": "units_sold", "save_name": "scatter"}),
+    "create_visualization:hist": ("create_visualization", {"chart_type": "hist", "x_column": "units_sold", "save_name": "hist"}),
+    "create_visualization:box": ("create_visualization", {"chart_type": "box", "x_column": "is_ev", "y_column": "units_sold", "save_name": "box"}),
+    "create_visualization:pie": ("create_visualization", {"chart_type": "pie", "x_column": "brand_country", "save_name": "pie"}),
+    "create_visualization:heatmap": ("create_visualization", {"chart_type": "heatmap", "x_column": "units_sold", "save_name": "heatmap"}),
+    "data_export": ("data_export", {"data_dict": {"rows": [{"brand": "Tesla", "units_sold": 69098}] * 1000}, "file_name": "export", "export_format": "json"}),
+    "create_file": ("create_file", {"file_name": "notes.md", "file_contents": "# bench\n" * 1000}),
+    "read_file_content": ("read_file_content", {}),
+    "list_files": ("list_files", {}),
+    "shell_exec": ("shell_exec", {"command": "echo bench"}),
+    "send_messages": ("send_messages", {"messages": "bench"}),
+}
+# 与数据集无关的工具只在第一个数据集上运行
+DATASET_INDEPENDENT = {"data_export", "create_file", "list_files", "shell_exec", "send_messages"}
+
+
+def synthetic_csv(rows: int) -> str:
+    """按自带CSV的分布放大生成合成数据：重复采样行并对数值列加扰动，分块写出以控制内存"""
+    import numpy as np
+    import pandas as pd
+
+    path = os.path.join(BENCH_DIR, "data", f"auto_sales_{rows}.csv")
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    base = pd.read_csv(BASE_CSV)
+    rng = np.random.default_rng(42)
+    tmp_path = path + ".tmp"
+    written = 0
+    while written < rows:
+        n = min(GENERATE_CHUNK_ROWS, rows - written)
+        chunk = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+        chunk["units_sold"] = (chunk["units_sold"] * rng.uniform(0.8, 1.2, n)).round().astype("int64")
+        jitter = rng.uniform(0.95, 1.05, n)
+        chunk["low_price"] = (chunk["low_price"] * jitter).round(2)
+        chunk["high_price"] = (chunk["high_price"] * jitter).round(2)
+        chunk.to_csv(tmp_path, mode="a", header=written == 0, index=False)
+        written += n
+    os.replace(tmp_path, path)
+    return path
+
+
+def _folder_bytes(folder: str) -> int:
+    total = 0
+    for root, _, files in os.walk(folder):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def _rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    maxrss = resource.getrusage(who).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_child(spec: dict) -> dict:
+    """子进程入口：执行一个基准用例并返回测量结果"""
+    sys.path.insert(0, REPO_ROOT)
+    from tools import TOOL_REGISTRY
+
+    tool = TOOL_REGISTRY[spec["tool"]]
+    task_folder = spec["task_folder"]
+    args = dict(spec["args"])
+    if "file_path" in tool.args:
+        args.setdefault("file_path", spec["file_path"])
+    if "file_paths" in tool.args:
+        args.setdefault("file_paths", [spec["file_path"]])
+    if "task_folder" in tool.args:
+        args["task_folder"] = task_folder
+    if "directory_path" in tool.args:
+        args.setdefault("directory_path", task_folder)
+
+    baseline_rss = _rss_mb()
+    bytes_before = _folder_bytes(task_folder)
+    timings = []
+    result = None
+    for _ in range(spec["repeat"]):
+        started = time.perf_counter()
+        result = tool.invoke(args)
+        timings.append(time.perf_counter() - started)
+    error = result.get("error") if isinstance(result, dict) else None
+    # 图表在渲染进程中绘制，关闭进程池回收子进程后才能取到它们的峰值RSS
+    charts = sys.modules.get("charts")
+    if charts is not None:
+        charts.shutdown_chart_pool()
+    return {"first_call_seconds": round(timings[0], 4),
+            "warm_seconds": round(min(timings[1:]), 4) if len(timings) > 1 else None,
+            "baseline_rss_mb": baseline_rss,
+            "peak_rss_mb": _rss_mb(),
+            "worker_peak_rss_mb": _rss_mb(resource.RUSAGE_CHILDREN),
+            "bytes_written": _folder_bytes(task_folder) - bytes_before,
+            "error": error}
+
+
+def _wait_with_rusage(proc: subprocess.Popen, timeout: float):
+    """等待子进程结束并取回它自己的资源使用情况（ru_maxrss为该子进程的峰值RSS）"""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+        if deadline and time.monotonic() > deadline:
+            proc.kill()
+            _, status, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = None
+            return rusage
+        time.sleep(0.05)
+
+
+def _child_env(cached: bool) -> dict:
+    return dict(os.environ) if cached else dict(os.environ, **UNCACHED_ENV)
+
+
+def bench_case(case: str, dataset: str, file_path: str, repeat: int, timeout: float, cached: bool = False) -> dict:
+    tool_name, args = CASES[case]
+    label = "".join(c if c.isalnum() else "_" for c in f"{case}_{dataset}")[-80:]
+    task_folder = os.path.join(BENCH_DIR, "runs", label)
+    shutil.rmtree(task_folder, ignore_errors=True)
+    os.makedirs(task_folder)
+    if tool_name == "read_file_content":
+        # 读取一个固定大小的文本文件，避免把整个CSV读进字符串
+        args = {"file_path": os.path.join(task_folder, "input.txt")}
+        with open(args["file_path"], "w", encoding="utf-8") as f:
+            f.write("bench line\n" * 10000)
+    spec = {"tool": tool_name, "args": args, "file_path": file_path, "task_folder": task_folder, "repeat": repeat}
+
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec, ensure_ascii=False)],
+                            cwd=os.getcwd(), env=_child_env(cached), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True)
+    record = {"case": case, "tool": tool_name, "dataset": dataset, "caches": "on" if cached else "off"}
+    # 先读完输出再回收进程，避免管道写满导致子进程阻塞
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout) if timeout else proc.communicate()
+    except subprocess.TimeoutExpired:
+        # 超时的子进程必须结束并回收，否则会继续占用CPU和内存，干扰后续用例
+        proc.kill()
+        proc.communicate()
+        record["error"] = f"timeout after {timeout}s"
+        return record
+    record["process_seconds"] = round(time.perf_counter() - started, 3)
+    lines = [line for line in stdout.splitlines() if line.startswith("BENCH_RESULT ")]
+    if proc.returncode != 0 or not lines:
+        record["error"] = (stderr or stdout)[-2000:]
+        return record
+    record.update(json.loads(lines[-1][len("BENCH_RESULT "):]))
+    return record
+
+
+def bench_graph(transcript: str, csv_path: str, timeout: float, cached: bool = False) -> dict:
+    """用LLM_REPLAY回放录制的LLM响应完整运行一次图；峰值RSS只包含主进程，不含图表进程池"""
+    output_dir = os.path.join(os.getcwd(), "output")
+    before = set(os.listdir(output_dir)) if os.path.isdir(output_dir) else set()
+    env = dict(_child_env(cached), LLM_REPLAY=os.path.abspath(transcript), LLM_CACHE="0")
+    env.pop("LLM_RECORD", None)
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "cli.py"), "run", "--csv", csv_path],
+                            cwd=os.getcwd(), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rusage = _wait_with_rusage(proc, timeout)
+    wall = time.perf_counter() - started
+    after = set(os.listdir(output_dir)) if os.path.isdir(output_dir) else set()
+    new_folders = [os.path.join(output_dir, name) for name in sorted(after - before)
+                   if os.path.isdir(os.path.join(output_dir, name))]
+    maxrss = rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"case": "graph_replay", "transcript": transcript, "csv": csv_path, "caches": "on" if cached else "off",
+            "returncode": proc.returncode, "wall_seconds": round(wall, 3),
+            "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 3),
+            "peak_rss_mb": round(maxrss, 1),
+            "bytes_written": sum(_folder_bytes(folder) for folder in new_folders),
+            "task_folders": new_folders}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="工具与整图的端到端基准测试")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--datasets", nargs="+", default=["base", "1m", "10m"], help="数据集：base、1m、10m或CSV路径")
+    parser.add_argument("--tools", nargs="+", default=list(CASES), help="要运行的用例，默认全部")
+    parser.add_argument("--repeat", type=int, default=3, help="每个子进程中调用工具的次数")
+    parser.add_argument("--timeout", type=float, default=1800, help="单个用例的超时时间（秒）")
+    parser.add_argument("--transcript", default=None, help="LLM录制文件，设置后额外回放运行一次完整的图")
+    parser.add_argument("--graph-csv", default="./data/China Automobile Sales Data.csv", help="回放运行使用的CSV路径，需与录制时一致")
+    parser.add_argument("--cached", action="store_true", help="保留图表缓存、派生结果和Feather旁路文件，测量缓存命中时的耗时")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "tools.json"), help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print("BENCH_RESULT " + json.dumps(run_child(json.loads(args.child)), ensure_ascii=False))
+        return 0
+
+    unknown = [case for case in args.tools if case not in CASES]
+    if unknown:
+        parser.error(f"未知用例: {unknown}，可选: {list(CASES)}")
+
+    results = []
+    for index, dataset in enumerate(args.datasets):
+        if dataset == "base":
+            file_path = BASE_CSV
+        elif dataset in SYNTHETIC_ROWS:
+            file_path = synthetic_csv(SYNTHETIC_ROWS[dataset])
+        else:
+            file_path = dataset
+        for case in args.tools:
+            if case in DATASET_INDEPENDENT and index > 0:
+                continue
+            record = bench_case(case, dataset, file_path, args.repeat, args.timeout, args.cached)
+            results.append(record)
+            print(f"{dataset:<6} {case:<32} first={record.get('first_call_seconds')}s warm={record.get('warm_seconds')}s "
+                  f"rss={record.get('peak_rss_mb')}MB written={record.get('bytes_written')}"
+                  + (" ERROR" if record.get("error") else ""))
+
+    graph = None
+    if args.transcript:
+        graph = bench_graph(args.transcript, args.graph_csv, args.timeout, args.cached)
+        print(f"graph_replay wall={graph['wall_seconds']}s rss={graph['peak_rss_mb']}MB written={graph['bytes_written']}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"python": sys.version.split()[0], "cpu_count": os.cpu_count(),
+                   "repeat": args.repeat, "caches": "on" if args.cached else "off", "tools": results, "graph": graph}, f, ensure_ascii=False, indent=2)
+    return 1 if any(record.get("error") for record in results) or (graph and graph["returncode"] != 0) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
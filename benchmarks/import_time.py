@@ -0,0 +1,89 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : import_time.py
+# Time       ：2025/7/11 16:05
+# Author     ：aigonna
+"""
+导入耗时预算检查：在干净的子进程中用python -X importtime导入各模块，
+记录原始importtime输出和汇总结果，超出预算或拉起了重量级依赖时以非零状态退出
+
+用法:
+    python benchmarks/import_time.py --output output/bench/import_time.json
+    python benchmarks/import_time.py --budget tools=1500 --budget nodes=2500
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 默认预算（毫秒），只需文件类工具的进程不应导入科学计算栈
+DEFAULT_BUDGETS_MS = {"tools": 1500, "nodes": 2000, "graphs": 2500}
+# 导入这些模块时不应被拉起的重量级依赖
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "seaborn", "langchain_community", "litellm"]
+
+
+def measure(module: str, repeat: int = 3) -> dict:
+    """多次在新进程中导入模块，取累计耗时最小的一次"""
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=REPO_ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"导入{module}失败:\n{proc.stderr[-2000:]}")
+        cumulative_us = None
+        imported = set()
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            parts = line[len("import time:"):].split("|")
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2].rstrip()
+            imported.add(name.strip().split(".")[0])
+            if name.strip() == module and not name.startswith("  "):
+                cumulative_us = int(parts[1])
+        run = {"module": module, "cumulative_ms": round((cumulative_us or 0) / 1000, 1),
+               "heavy_imports": sorted(m for m in HEAVY_MODULES if m in imported),
+               "raw": proc.stderr}
+        if best is None or run["cumulative_ms"] < best["cumulative_ms"]:
+            best = run
+    return best
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="检查模块导入耗时预算")
+    parser.add_argument("--modules", nargs="+", default=list(DEFAULT_BUDGETS_MS), help="要检查的模块")
+    parser.add_argument("--budget", action="append", default=[], help="覆盖预算，格式为module=毫秒")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块的测量次数")
+    parser.add_argument("--output", default=os.path.join("output", "bench", "import_time.json"), help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for item in args.budget:
+        module, value = item.split("=", 1)
+        budgets[module] = float(value)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    results = []
+    for module in args.modules:
+        run = measure(module, args.repeat)
+        # 原始importtime输出单独保存，便于定位具体的慢模块
+        raw_path = os.path.splitext(args.output)[0] + f".{module}.importtime.txt"
+        with open(raw_path, "w", encoding="utf-8") as f:
+            f.write(run.pop("raw"))
+        run["budget_ms"] = budgets.get(module)
+        run["within_budget"] = ((run["budget_ms"] is None or run["cumulative_ms"] <= run["budget_ms"])
+                                and not run["heavy_imports"])
+        run["importtime_log"] = raw_path
+        results.append(run)
+        print(f"{module:<10} {run['cumulative_ms']:>8.1f} ms  budget={run['budget_ms']}  heavy={run['heavy_imports']}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"python": sys.version.split()[0], "results": results}, f, ensure_ascii=False, indent=2)
+    return 0 if all(run["within_budget"] for run in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
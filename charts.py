@@ -0,0 +1,424 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : charts.py
+# Time       ：2025/7/18 10:36
+# Author     ：aigonna
+"""
+图表渲染引擎
+
+    - 使用Agg后端和面向对象的Figure API，每个图表有独立的Figure，不依赖pyplot全局状态
+    - 在可复用的spawn进程池中渲染，工作进程启动时预先导入绘图库、设置中文字体并渲染一次中文文本，
+      首个图表不再承担字体缓存的加载开销
+    - 同一步骤请求的多个图表提交到进程池后并发渲染
+    - 绘图前先聚合：柱状图预先按类别求均值（不计算置信区间），折线图用LTTB降采样，
+      （同一x有多行时先按x求均值），散点图随机抽样或改为六边形分箱，大数据量箱线图预先计算统计量
+    - 输出档案：preview（PNG，低DPI，默认）、print（PNG，300 DPI）、svg（矢量图）
+
+CHART_WORKERS=0时在当前进程中渲染（加锁串行），适用于不便创建子进程的环境。
+相同数据（按内容指纹）和相同图表参数的图表只渲染一次，之后从CHART_CACHE_DIR中复制。
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+
+CHART_PRESETS = {
+    "preview": {"format": "png", "dpi": 100},
+    "print": {"format": "png", "dpi": 300},
+    "svg": {"format": "svg", "dpi": 100},
+}
+# 默认输出档案
+CHART_PRESET = os.getenv("CHART_PRESET", "preview")
+# 渲染进程数，0表示在当前进程中渲染
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", str(min(4, os.cpu_count() or 1))))
+CHART_TYPES = ("bar", "line", "scatter", "hist", "box", "pie", "heatmap")
+FIGURE_SIZE = (12, 8)
+
+# 绘图前的聚合阈值：标记数量有上限，渲染耗时不随数据量增长
+MAX_LINE_POINTS = int(os.getenv("CHART_MAX_LINE_POINTS", "2000"))
+LINE_MARKER_MAX_POINTS = 200
+MAX_SCATTER_POINTS = int(os.getenv("CHART_MAX_SCATTER_POINTS", "5000"))
+SCATTER_HEXBIN_ROWS = int(os.getenv("CHART_SCATTER_HEXBIN_ROWS", "200000"))
+MAX_BOX_ROWS = int(os.getenv("CHART_MAX_BOX_ROWS", "100000"))
+MAX_BOX_FLIERS = 200
+
+# 图表缓存：以数据集内容指纹+规范化的图表参数为键，命中时直接复制已渲染的文件，CHART_CACHE=0关闭
+CHART_CACHE = os.getenv("CHART_CACHE", "1") != "0"
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", os.path.join("output", ".chart_cache"))
+CHART_CACHE_MAX_MB = float(os.getenv("CHART_CACHE_MAX_MB", "512"))
+# 绘图逻辑变化会改变输出时递增，使旧缓存失效
+CHART_RENDER_VERSION = 3
+
+_pool = None
+_pool_lock = threading.Lock()
+_render_lock = threading.Lock()
+_warmed = False
+
+
+def resolve_preset(preset: str = None) -> dict:
+    name = preset or CHART_PRESET
+    if name not in CHART_PRESETS:
+        raise ValueError(f"Unsupported chart preset: {name}, expected one of {list(CHART_PRESETS)}")
+    return dict(CHART_PRESETS[name], name=name)
+
+
+def warm_up():
+    """导入绘图库并设置中文字体，渲染一次中文文本以加载字体缓存；每个进程只执行一次"""
+    global _warmed
+    if _warmed:
+        return
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import rcParams
+    from matplotlib.figure import Figure
+    import seaborn  # noqa: F401  预先导入，避免首个图表承担导入开销
+    import dataset  # noqa: F401
+
+    # 设置中文字体
+    rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
+    rcParams['axes.unicode_minus'] = False
+    fig = Figure(figsize=(1, 1))
+    fig.text(0.5, 0.5, "预热 warm-up")
+    fig.canvas.draw()
+    _warmed = True
+
+
+def lttb(x, y, n_out: int):
+    """
+    Largest-Triangle-Three-Buckets降采样，保留折线的视觉形状
+    :param x: 单调的数值型x（numpy数组）
+    :param y: 数值型y（numpy数组）
+    :param n_out: 输出点数
+    :return: 选中点的下标数组
+    """
+    import numpy as np
+
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # 以上一个选中点和下一个桶的平均点为底，选当前桶中三角形面积最大的点
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def _as_float(values):
+    """把数值型或日期型列转为float数组，其他类型返回None"""
+    import numpy as np
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=float)
+    return None
+
+
+def _box_stats(values, label) -> dict:
+    """预先计算箱线图统计量（与matplotlib默认的1.5倍IQR须线一致），离群点最多保留MAX_BOX_FLIERS个"""
+    import numpy as np
+
+    values = values[~np.isnan(values)]
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    fliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+    if len(fliers) > MAX_BOX_FLIERS:
+        fliers = np.random.default_rng(0).choice(fliers, MAX_BOX_FLIERS, replace=False)
+    return {"label": label, "q1": q1, "med": median, "q3": q3, "fliers": fliers,
+            "whislo": inside.min() if len(inside) else q1, "whishi": inside.max() if len(inside) else q3}
+
+
+def _draw_bar(ax, df, x_column: str, y_column: str = None):
+    import pandas as pd
+    import seaborn as sns
+
+    if not y_column:
+        df[x_column].value_counts().head(20).plot(kind='bar', ax=ax)
+        return None
+    # 预先按类别求均值，不再对每一行做bootstrap置信区间；与seaborn的默认顺序一致：
+    # 数值、日期按大小排序，类别列按categories的顺序，其余按首次出现的顺序
+    key = df[x_column]
+    ordered = (pd.api.types.is_numeric_dtype(key) or pd.api.types.is_datetime64_any_dtype(key)
+               or isinstance(key.dtype, pd.CategoricalDtype))
+    means = df.groupby(x_column, observed=True, sort=ordered)[y_column].mean().reset_index()
+    means[x_column] = means[x_column].astype(str)
+    sns.barplot(data=means, x=x_column, y=y_column, errorbar=None, ax=ax)
+    return f"mean of {y_column} by {x_column}: {len(means)} bars from {len(df)} rows"
+
+
+def _draw_line(ax, df, x_column: str, y_column: str = None):
+    import numpy as np
+
+    note = None
+    if y_column:
+        data = df[[x_column, y_column]].dropna()
+        x, y = data[x_column], data[y_column]
+    else:
+        y = df[x_column].dropna()
+        x = y.index.to_series()
+    if len(y) > MAX_LINE_POINTS and _as_float(y) is not None:
+        rows = len(y)
+        x_values = _as_float(x)
+        if x_values is not None and x.nunique() < rows:
+            # 同一个x对应多行时先按x求均值，否则降采样只会挑出每个x上的极值，画成竖线
+            means = y.groupby(x.to_numpy(), sort=True).mean()
+            x, y = means.index.to_series(), means
+            x_values = _as_float(x)
+            note = f"mean of {len(means)} distinct x values from {rows} rows"
+            if y_column:
+                y_column = f"{y_column} (mean)"
+        elif x_values is not None and not x.is_monotonic_increasing:
+            order = np.argsort(x_values, kind="stable")
+            x, y, x_values = x.iloc[order], y.iloc[order], x_values[order]
+        if len(y) > MAX_LINE_POINTS:
+            selected = lttb(np.arange(len(y), dtype=float) if x_values is None else x_values, _as_float(y), MAX_LINE_POINTS)
+            note = f"lttb: {len(selected)} of {len(y)} points" + (f" ({note})" if note else "")
+            x, y = x.iloc[selected], y.iloc[selected]
+    # 点数较多时不画标记，避免线条被标记淹没
+    ax.plot(x.to_numpy(), y.to_numpy(), marker='o' if len(y) <= LINE_MARKER_MAX_POINTS else None)
+    if y_column:
+        ax.set_xlabel(x_column)
+        ax.set_ylabel(y_column)
+    return note
+
+
+def _draw_scatter(ax, df, x_column: str, y_column: str):
+    data = df[[x_column, y_column]].dropna()
+    note = None
+    x_values, y_values = _as_float(data[x_column]), _as_float(data[y_column])
+    if len(data) > SCATTER_HEXBIN_ROWS and x_values is not None and y_values is not None:
+        # 点数过多时改为六边形分箱密度图
+        collection = ax.hexbin(x_values, y_values, gridsize=60, mincnt=1, bins='log', cmap='viridis')
+        ax.figure.colorbar(collection, ax=ax, label="count (log)")
+        note = f"hexbin of {len(data)} points"
+    else:
+        if len(data) > MAX_SCATTER_POINTS:
+            data = data.sample(n=MAX_SCATTER_POINTS, random_state=0)
+            note = f"random sample: {MAX_SCATTER_POINTS} points"
+        ax.scatter(data[x_column], data[y_column], alpha=0.6)
+    ax.set_xlabel(x_column)
+    ax.set_ylabel(y_column)
+    return note
+
+
+def _draw_box(ax, df, x_column: str, y_column: str = None):
+    import seaborn as sns
+
+    if len(df) <= MAX_BOX_ROWS:
+        if y_column:
+            sns.boxplot(data=df, x=x_column, y=y_column, ax=ax)
+        else:
+            sns.boxplot(data=df, y=x_column, ax=ax)
+        return None
+    # 大数据量时先计算每组的统计量，再用bxp绘制，离群点只保留抽样
+    if y_column:
+        groups = df.groupby(x_column, observed=True, sort=False)[y_column]
+        stats = [_box_stats(values.to_numpy(dtype=float), str(label)) for label, values in groups if values.notna().any()]
+        ax.set_xlabel(x_column)
+        ax.set_ylabel(y_column)
+    else:
+        stats = [_box_stats(df[x_column].to_numpy(dtype=float), x_column)]
+    ax.bxp(stats, showfliers=True, patch_artist=True)
+    return f"precomputed box statistics of {len(df)} rows, fliers capped at {MAX_BOX_FLIERS} per box"
+
+
+def _draw(ax, df, chart_type: str, x_column: str, y_column: str = None, file_path: str = None):
+    """绘制图表，大数据量时先分组、分箱或降采样；返回描述聚合方式的说明，未聚合时返回None"""
+    import numpy as np
+    import seaborn as sns
+
+    note = None
+    if chart_type == "bar":
+        note = _draw_bar(ax, df, x_column, y_column)
+        ax.tick_params(axis='x', labelrotation=45)
+
+    elif chart_type == "line":
+        note = _draw_line(ax, df, x_column, y_column)
+
+    elif chart_type == "scatter":
+        note = _draw_scatter(ax, df, x_column, y_column)
+
+    elif chart_type == "hist":
+        ax.hist(df[x_column], bins=30, alpha=0.7, edgecolor='black')
+        ax.set_xlabel(x_column)
+        ax.set_ylabel("Frequency")
+
+    elif chart_type == "box":
+        note = _draw_box(ax, df, x_column, y_column)
+        ax.tick_params(axis='x', labelrotation=45)
+
+    elif chart_type == "pie":
+        value_counts = df[x_column].value_counts().head(10)
+        ax.pie(value_counts.values, labels=value_counts.index, autopct='%1.1f%%')
+
+    elif chart_type == "heatmap":
+        # 数值型列的相关性热力图
+        if file_path:
+            import artifacts
+            correlation_matrix = artifacts.correlation_matrix(file_path)
+        else:
+            correlation_matrix = df.select_dtypes(include=[np.number]).corr()
+        sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', center=0, ax=ax)
+    return note
+
+
+def render_chart(file_path: str, chart_type: str, x_column: str, y_column: str, title: str,
+                 output_path: str, preset: str = None) -> dict:
+    """
+    渲染一个图表并保存，在渲染进程中执行；数据通过dataset.load_dataframe读取（进程内缓存或Feather旁路文件）
+    :return: 保存的文件路径和聚合说明
+    """
+    warm_up()
+    from matplotlib.figure import Figure
+    from dataset import load_dataframe
+
+    options = resolve_preset(preset)
+    df = load_dataframe(file_path)
+    fig = Figure(figsize=FIGURE_SIZE)
+    ax = fig.add_subplot()
+    aggregation = _draw(ax, df, chart_type, x_column, y_column, file_path)
+    ax.set_title(title, fontsize=16, fontweight='bold')
+    fig.tight_layout()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    # 先写临时文件再替换：覆盖同名输出时换成新文件，不会原地改写其他位置仍在引用的内容
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        fig.savefig(tmp_path, dpi=options["dpi"], format=options["format"], bbox_inches='tight')
+        os.replace(tmp_path, output_path)
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+    return {"path": output_path, "aggregation": aggregation}
+
+
+def get_chart_pool() -> ProcessPoolExecutor:
+    """可复用的渲染进程池，工作进程启动时执行warm_up"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 使用spawn避免fork带着线程池和日志锁进入子进程
+            _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, initializer=warm_up,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def chart_cache_key(file_path: str, chart_type: str, x_column: str, y_column: str, title: str, preset: str = None) -> str:
+    """数据集内容指纹加规范化图表参数的摘要，影响输出图像的参数都包含在内"""
+    from dataset import dataset_fingerprint
+
+    options = resolve_preset(preset)
+    spec = {"dataset": dataset_fingerprint(file_path), "chart_type": chart_type.strip().lower(),
+            "x_column": x_column.strip(), "y_column": (y_column or "").strip() or None, "title": title,
+            "format": options["format"], "dpi": options["dpi"], "figure_size": FIGURE_SIZE,
+            "aggregation": [MAX_LINE_POINTS, MAX_SCATTER_POINTS, SCATTER_HEXBIN_ROWS, MAX_BOX_ROWS],
+            "version": CHART_RENDER_VERSION}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _copy_file(source: str, target: str):
+    """
+    复制到临时文件后替换目标。缓存文件与输出文件不能共用inode（硬链接）：
+    输出文件之后可能被同名的其他图表覆盖，会连带改写缓存中的内容
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def _cache_paths(key: str, extension: str) -> tuple:
+    cache_dir = os.path.abspath(CHART_CACHE_DIR)
+    return os.path.join(cache_dir, f"{key}{extension}"), os.path.join(cache_dir, f"{key}.json")
+
+
+def _cache_lookup(key: str, output_path: str):
+    image_path, meta_path = _cache_paths(key, os.path.splitext(output_path)[1])
+    if not (os.path.exists(image_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if os.path.abspath(output_path) != image_path:
+        _copy_file(image_path, output_path)
+    os.utime(meta_path)
+    return {"path": output_path, "aggregation": meta.get("aggregation"), "cache_hit": True,
+            "cached_from": meta.get("first_output")}
+
+
+def _cache_store(key: str, rendered: dict):
+    image_path, meta_path = _cache_paths(key, os.path.splitext(rendered["path"])[1])
+    try:
+        _copy_file(rendered["path"], image_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"aggregation": rendered.get("aggregation"), "first_output": rendered["path"]}, f, ensure_ascii=False)
+        _evict_cache()
+    except OSError as e:
+        logger.warning(f"写入图表缓存失败: {image_path}, {e}")
+
+
+def _evict_cache():
+    """缓存目录超过CHART_CACHE_MAX_MB时，按最近使用时间从旧到新删除"""
+    cache_dir = os.path.abspath(CHART_CACHE_DIR)
+    entries = {}
+    for name in os.listdir(cache_dir):
+        key, extension = os.path.splitext(name)
+        entry = entries.setdefault(key, {"files": [], "used": 0.0, "size": 0})
+        path = os.path.join(cache_dir, name)
+        entry["files"].append(path)
+        entry["size"] += os.path.getsize(path)
+        if extension == ".json":
+            entry["used"] = os.path.getmtime(path)
+    total = sum(entry["size"] for entry in entries.values())
+    max_bytes = CHART_CACHE_MAX_MB * 1024 * 1024
+    for entry in sorted(entries.values(), key=lambda item: item["used"]):
+        if total <= max_bytes:
+            break
+        for path in entry["files"]:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        total -= entry["size"]
+
+
+def render(file_path: str, chart_type: str, x_column: str, y_column: str, title: str,
+           output_path: str, preset: str = None) -> dict:
+    """
+    渲染图表：先查图表缓存，命中时复制已有文件并返回cache_hit=True；
+    未命中时提交到渲染进程池并等待结果，可被多个线程同时调用，图表之间并发渲染
+    """
+    key = chart_cache_key(file_path, chart_type, x_column, y_column, title, preset) if CHART_CACHE else None
+    if key:
+        cached = _cache_lookup(key, output_path)
+        if cached is not None:
+            logger.info(f"🖼️ 图表缓存命中: {output_path}")
+            return cached
+    args = (file_path, chart_type, x_column, y_column, title, output_path, preset)
+    if CHART_WORKERS <= 0:
+        with _render_lock:
+            rendered = render_chart(*args)
+    else:
+        rendered = get_chart_pool().submit(render_chart, *args).result()
+    if key:
+        _cache_store(key, rendered)
+    return dict(rendered, cache_hit=False)
+
+
+def shutdown_chart_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
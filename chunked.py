@@ -0,0 +1,409 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : chunked.py
+# Time       ：2025/7/22 14:40
+# Author     ：aigonna
+"""
+分块流式分析引擎：超出内存的CSV按CHUNK_ROWS行分块读取，只保留可合并的聚合结果
+
+data_statistics_analysis、category_analysis、trend_analysis、outlier_detection在
+use_chunked()为真时改用这里的实现，返回与内存引擎相同结构的结果，峰值内存只与分块大小有关：
+    - 计数/均值/标准差/最小值/最大值：sketches.Moments按块合并，结果精确
+    - 分位数（describe的25%/50%/75%、IQR，含日期列）：KLL草图，近似
+    - nunique：不同值不超过CHUNK_MAX_DISTINCT时精确，否则用HyperLogLog估计
+    - top_values：按块累加value_counts，超出CHUNK_MAX_DISTINCT时只保留高频值（误差上界见结果）
+    - 分组聚合：每块计算count/sum/min/max/二阶中心矩的分组部分结果后合并，结果精确
+    - 重复行：sketches.DuplicateEstimator，行哈希不超过DUPLICATE_HASH_LIMIT时精确，否则按哈希抽样估计
+近似得到的字段及其误差界记录在结果的approximations中。
+"""
+import os
+import numpy as np
+import pandas as pd
+from dataset import DATASET_DTYPE_PROFILE, detect_encoding, add_rows_processed, _looks_like_dates
+from sketches import Moments, QuantileSketch, HyperLogLog, DuplicateEstimator, hash_column, hash_values, combine_hashes
+
+# auto：文件超过CHUNKED_THRESHOLD_MB时使用分块引擎；on：总是使用；off：总是整表加载
+CHUNKED_MODE = os.getenv("CHUNKED_MODE", "auto")
+CHUNKED_THRESHOLD_MB = float(os.getenv("CHUNKED_THRESHOLD_MB", "2048"))
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", "500000"))
+# 单列value_counts保留的不同值上限
+CHUNK_MAX_DISTINCT = int(os.getenv("CHUNK_MAX_DISTINCT", "100000"))
+# 结果中最多列出的异常值个数（异常值总数始终精确）
+OUTLIER_MAX_VALUES = int(os.getenv("OUTLIER_MAX_VALUES", "100000"))
+
+
+def use_chunked(file_path: str) -> bool:
+    """当前文件是否使用分块引擎"""
+    if CHUNKED_MODE == "on":
+        return True
+    if CHUNKED_MODE == "off":
+        return False
+    return os.path.getsize(file_path) > CHUNKED_THRESHOLD_MB * 1024 * 1024
+
+
+def iter_chunks(file_path: str, columns: list = None):
+    """按CHUNK_ROWS行分块读取CSV，读取的行数计入当前线程的rows_processed()"""
+    encoding = detect_encoding(file_path)
+    reader = pd.read_csv(file_path, encoding=encoding, usecols=columns, chunksize=CHUNK_ROWS)
+    with reader:
+        for chunk in reader:
+            add_rows_processed(len(chunk))
+            yield chunk
+
+
+def _numeric(column: pd.Series) -> pd.Series:
+    return pd.to_numeric(column, errors='coerce')
+
+
+def _column_roles(chunk: pd.DataFrame) -> tuple:
+    """根据第一个分块确定数值列、日期列和分类列；compact档案下日期字符串列按日期统计（与整表加载一致）"""
+    numeric = chunk.select_dtypes(include=[np.number]).columns.tolist()
+    dates, categorical = [], []
+    for name in chunk.select_dtypes(include=['object', 'string', 'category']).columns:
+        if DATASET_DTYPE_PROFILE == "compact" and _looks_like_dates(chunk[name]):
+            dates.append(name)
+        else:
+            categorical.append(name)
+    return numeric, dates, categorical
+
+
+def _date_numbers(column: pd.Series) -> pd.Series:
+    """日期列转为纳秒时间戳（浮点数），无法解析的值为NaN"""
+    parsed = pd.to_datetime(column, errors='coerce', format='ISO8601')
+    return pd.Series(parsed.to_numpy(dtype='datetime64[ns]').astype('int64'), index=column.index).where(parsed.notna())
+
+
+def _timestamp(value: float):
+    return pd.NaT if np.isnan(value) else pd.Timestamp(int(round(value)))
+
+
+class ValueCounter:
+    """按块累加的value_counts，不同值过多时只保留高频值，error为任一值计数的最大低估量"""
+
+    def __init__(self):
+        self.counts = pd.Series(dtype='int64')
+        self.error = 0
+        self.nulls = 0
+        self.hll = HyperLogLog()
+
+    def update(self, column: pd.Series, hashes: np.ndarray = None):
+        """hashes为该列逐行的哈希（hash_column），已计算过时传入以免重复计算"""
+        missing = column.isna().to_numpy()
+        self.nulls += int(missing.sum())
+        self.hll.update(hash_values(column) if hashes is None else hashes[~missing])
+        counts = column.value_counts()
+        self.counts = self.counts.add(counts, fill_value=0).astype('int64')
+        if len(self.counts) > CHUNK_MAX_DISTINCT:
+            self.counts = self.counts.sort_values(ascending=False)
+            self.error += int(self.counts.iloc[CHUNK_MAX_DISTINCT])
+            self.counts = self.counts.iloc[:CHUNK_MAX_DISTINCT]
+
+    @property
+    def exact(self) -> bool:
+        return self.error == 0
+
+    def nunique(self) -> int:
+        return len(self.counts) if self.exact else self.hll.estimate()
+
+    def top(self, n: int = 10) -> dict:
+        return {key: int(value) for key, value in self.counts.sort_values(ascending=False, kind='stable').head(n).items()}
+
+
+class CorrelationAccumulator:
+    """成对完整观测的Pearson相关系数（与DataFrame.corr一致），按块累加平移后的和与交叉积"""
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        self.shift = None
+        size = len(self.columns)
+        self.n = np.zeros((size, size))
+        self.sx = np.zeros((size, size))
+        self.sxx = np.zeros((size, size))
+        self.sxy = np.zeros((size, size))
+
+    def update(self, frame: pd.DataFrame):
+        values = frame[self.columns].to_numpy(dtype=float)
+        if self.shift is None:
+            # 以第一个分块的均值平移，减小大数值时的舍入误差
+            with np.errstate(invalid='ignore'):
+                self.shift = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(len(self.columns))
+        values = values - self.shift
+        mask = (~np.isnan(values)).astype(float)
+        filled = np.nan_to_num(values)
+        self.n += mask.T @ mask
+        self.sx += filled.T @ mask          # sx[i, j]：j也非空时i的和
+        self.sxx += (filled ** 2).T @ mask
+        self.sxy += filled.T @ filled
+
+    def result(self) -> pd.DataFrame:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = self.n * self.sxy - self.sx * self.sx.T
+            var = (self.n * self.sxx - self.sx ** 2) * (self.n * self.sxx - self.sx ** 2).T
+            corr = np.where(self.n > 1, cov / np.sqrt(var), np.nan)
+        corr = np.clip(corr, -1, 1)
+        np.fill_diagonal(corr, np.where(np.diag(self.n) > 1, 1.0, np.nan))
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+
+def group_partial(keys, values: pd.Series) -> pd.DataFrame:
+    """一个分块的分组部分结果：count、sum、min、max、mean、m2（二阶中心矩）"""
+    grouped = values.groupby(keys, observed=True, sort=False)
+    partial = grouped.agg(['count', 'sum', 'min', 'max'])
+    partial['mean'] = partial['sum'] / partial['count'].where(partial['count'] > 0)
+    partial['m2'] = (grouped.var(ddof=0) * partial['count']).fillna(0.0)
+    return partial
+
+
+def merge_partials(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    """按Chan公式合并两份分组部分结果"""
+    if left is None:
+        return right
+    index = left.index.union(right.index)
+    a, b = left.reindex(index), right.reindex(index)
+    count_a, count_b = a['count'].fillna(0), b['count'].fillna(0)
+    count = count_a + count_b
+    mean_a, mean_b = a['mean'].fillna(0), b['mean'].fillna(0)
+    delta = mean_b - mean_a
+    safe = count.where(count > 0, 1)
+    merged = pd.DataFrame({
+        "count": count,
+        "sum": a['sum'].fillna(0) + b['sum'].fillna(0),
+        "min": np.fmin(a['min'], b['min']),
+        "max": np.fmax(a['max'], b['max']),
+        "mean": (mean_a + delta * count_b / safe).where(count > 0),
+        "m2": a['m2'].fillna(0) + b['m2'].fillna(0) + delta ** 2 * count_a * count_b / safe,
+    }, index=index)
+    return merged
+
+
+def finalize_partial(partial: pd.DataFrame, integer: bool = False) -> pd.DataFrame:
+    """部分结果转为groupby().agg(['sum', 'mean', 'count', 'std', 'min', 'max'])的形式"""
+    count = partial['count'].astype('int64')
+    result = pd.DataFrame({
+        "sum": partial['sum'],
+        "mean": partial['sum'] / count.where(count > 0),
+        "count": count,
+        "std": np.sqrt(partial['m2'] / (count - 1).where(count > 1)),
+        "min": partial['min'],
+        "max": partial['max'],
+    }, index=partial.index)
+    if integer:
+        # 整数列的和、最小值、最大值保持整数，与整表加载时一致
+        result['sum'] = result['sum'].astype('int64')
+        if count.gt(0).all():
+            result[['min', 'max']] = result[['min', 'max']].astype('int64')
+    return result
+
+
+def data_statistics(file_path: str) -> dict:
+    """分块计算data_statistics_analysis的统计结果"""
+    numeric = dates = categorical = None
+    moments = correlation = date_moments = None
+    sketches, date_sketches, counters = {}, {}, {}
+    null_counts = None
+    total_rows = 0
+    duplicates = DuplicateEstimator()
+
+    for chunk in iter_chunks(file_path):
+        if numeric is None:
+            numeric, dates, categorical = _column_roles(chunk)
+            moments, correlation, date_moments = Moments(numeric), CorrelationAccumulator(numeric), Moments(dates)
+            sketches = {name: QuantileSketch() for name in numeric}
+            date_sketches = {name: QuantileSketch() for name in dates}
+            counters = {name: ValueCounter() for name in categorical}
+            null_counts = pd.Series(0, index=chunk.columns, dtype='int64')
+        numbers = pd.DataFrame({name: _numeric(chunk[name]) for name in numeric}, index=chunk.index)
+        moments.update(numbers)
+        correlation.update(numbers)
+        for name in numeric:
+            sketches[name].update(numbers[name].to_numpy())
+        timestamps = pd.DataFrame({name: _date_numbers(chunk[name]) for name in dates}, index=chunk.index)
+        date_moments.update(timestamps)
+        for name in dates:
+            date_sketches[name].update(timestamps[name].to_numpy())
+        column_hashes = {name: hash_column(column) for name, column in chunk.items()}
+        for name in categorical:
+            counters[name].update(chunk[name], column_hashes[name])
+        null_counts = null_counts.add(chunk.isnull().sum(), fill_value=0).astype('int64')
+        total_rows += len(chunk)
+
+        duplicates.update(combine_hashes(list(column_hashes.values())))
+
+    if numeric is None:
+        raise ValueError("数据文件为空")
+    std, mean = moments.std(), moments.final_mean()
+    numerical_statistics = {}
+    for i, name in enumerate(numeric):
+        numerical_statistics[name] = {
+            "count": float(moments.count[i]), "mean": mean[i], "std": std[i], "min": moments.min[i],
+            "25%": sketches[name].quantile(0.25), "50%": sketches[name].quantile(0.5),
+            "75%": sketches[name].quantile(0.75), "max": moments.max[i]}
+    date_mean = date_moments.final_mean()
+    for i, name in enumerate(dates):
+        sketch = date_sketches[name]
+        numerical_statistics[name] = {
+            "count": int(date_moments.count[i]), "mean": _timestamp(date_mean[i]), "min": _timestamp(date_moments.min[i]),
+            "25%": _timestamp(sketch.quantile(0.25)), "50%": _timestamp(sketch.quantile(0.5)),
+            "75%": _timestamp(sketch.quantile(0.75)), "max": _timestamp(date_moments.max[i]), "std": np.nan}
+    categorical_statistics = {name: {"unique_count": counter.nunique(), "top_values": counter.top(10),
+                                     "null_count": counter.nulls}
+                              for name, counter in counters.items()}
+
+    approximations = {}
+    rank_errors = [sketch.rank_error() for sketch in list(sketches.values()) + list(date_sketches.values())
+                   if sketch.rank_error()]
+    if rank_errors:
+        approximations["numerical_statistics.quantiles"] = {"method": "KLL", "rank_error": max(rank_errors)}
+    for name, counter in counters.items():
+        if not counter.exact:
+            approximations[f"categorical_statistics.{name}"] = {
+                "method": "HyperLogLog + heavy hitters", "unique_count_relative_error": counter.hll.relative_error(),
+                "top_values_max_undercount": counter.error}
+    duplicate_result = duplicates.result()
+    duplicate_rows = duplicate_result.pop("duplicate_rows")
+    if not duplicates.exact:
+        approximations["data_quality.duplicate_rows"] = dict({"method": "hashed-row sampling"}, **duplicate_result)
+
+    return {
+        "numerical_statistics": numerical_statistics,
+        "categorical_statistics": categorical_statistics,
+        "correlation_matrix": correlation.result().to_dict(),
+        "data_quality": {
+            "total_rows": total_rows,
+            "duplicate_rows": duplicate_rows,
+            "missing_data_summary": null_counts.to_dict(),
+            "missing_percentage": (null_counts / max(total_rows, 1) * 100).to_dict()
+        },
+        "engine": "chunked",
+        "approximations": approximations
+    }
+
+
+def category_summary(file_path: str, category_column: str, value_column: str) -> pd.DataFrame:
+    """分块计算groupby(category_column)[value_column].agg(['sum', 'mean', 'count', 'std', 'min', 'max'])"""
+    partial, integer = None, True
+    for chunk in iter_chunks(file_path, [category_column, value_column]):
+        values = chunk[value_column]
+        integer = integer and pd.api.types.is_integer_dtype(values.dtype)
+        partial = merge_partials(partial, group_partial(chunk[category_column], _numeric(values)))
+    if partial is None:
+        raise ValueError("数据文件为空")
+    summary = finalize_partial(partial, integer).sort_index()
+    summary.index.name = category_column
+    return summary.reset_index()
+
+
+def monthly_partials(file_path: str, date_column: str, value_column: str) -> tuple:
+    """
+    分块计算按年月的分组部分结果（键为year*100+month），以及日期范围
+    :return: (部分结果, 是否整数列, 最早日期, 最晚日期)
+    """
+    partial, integer = None, True
+    start = end = None
+    for chunk in iter_chunks(file_path, [date_column, value_column]):
+        dates = pd.to_datetime(chunk[date_column])
+        values = chunk[value_column]
+        integer = integer and pd.api.types.is_integer_dtype(values.dtype)
+        valid = dates.notna()
+        if not valid.any():
+            continue
+        dates, values = dates[valid], _numeric(values[valid])
+        keys = (dates.dt.year * 100 + dates.dt.month).rename("period")
+        partial = merge_partials(partial, group_partial(keys, values))
+        start = dates.min() if start is None else min(start, dates.min())
+        end = dates.max() if end is None else max(end, dates.max())
+    if partial is None:
+        raise ValueError(f"列'{date_column}'中没有有效日期")
+    return partial, integer, start, end
+
+
+def trend_rollups(monthly: pd.DataFrame, integer: bool) -> dict:
+    """
+    由月度汇总逐级得到trend_analysis的年度、月度、季度趋势表（sum、mean、count），只在按月的小表上计算
+    :param monthly: 以year*100+month为索引、包含sum和count列的月度汇总
+    :param integer: 数值列是否为整数，整数时和保持整数
+    """
+    monthly = monthly[['sum', 'count']].sort_index()
+    year, month = monthly.index // 100, monthly.index % 100
+
+    def rollup(keys: dict) -> pd.DataFrame:
+        table = monthly.groupby([pd.Index(values, name=name) for name, values in keys.items()]).sum()
+        table['count'] = table['count'].astype('int64')
+        if integer:
+            table['sum'] = table['sum'].astype('int64')
+        table['mean'] = table['sum'] / table['count'].where(table['count'] > 0)
+        return table[['sum', 'mean', 'count']].reset_index()
+
+    return {
+        "yearly": rollup({"year": year}),
+        "monthly": rollup({"year": year, "month": month}),
+        "quarterly": rollup({"year": year, "quarter": (month - 1) // 3 + 1}),
+    }
+
+
+def trend_tables(file_path: str, date_column: str, value_column: str) -> dict:
+    """分块计算trend_analysis的年度、月度、季度汇总（sum、mean、count），季度和年度由月度部分结果汇总得到"""
+    partial, integer, start, end = monthly_partials(file_path, date_column, value_column)
+    return dict(trend_rollups(partial, integer), start_date=start, end_date=end)
+
+
+def outlier_summary(file_path: str, column_name: str, method: str = "iqr") -> dict:
+    """
+    分块计算outlier_detection的结果：第一遍得到精确的计数/均值/标准差和近似四分位数，
+    第二遍按边界统计异常值（计数精确，列出的值不超过OUTLIER_MAX_VALUES个）
+    """
+    moments, sketch = Moments([column_name]), QuantileSketch()
+    for chunk in iter_chunks(file_path, [column_name]):
+        values = _numeric(chunk[column_name]).to_frame()
+        moments.update(values)
+        sketch.update(values[column_name].to_numpy())
+    total = int(moments.count[0])
+    if not total:
+        raise ValueError(f"列'{column_name}'中没有数值")
+    mean, std = float(moments.final_mean()[0]), float(moments.std()[0])
+
+    rules = {}
+    if method in ["iqr", "both"]:
+        q1, q3 = sketch.quantile(0.25), sketch.quantile(0.75)
+        iqr = q3 - q1
+        rules["iqr_method"] = (q1 - 1.5 * iqr, q3 + 1.5 * iqr)
+    if method in ["zscore", "both"]:
+        rules["zscore_method"] = (mean - 3 * std, mean + 3 * std)
+    found = {name: {"count": 0, "values": []} for name in rules}
+    if rules:
+        for chunk in iter_chunks(file_path, [column_name]):
+            values = _numeric(chunk[column_name]).dropna()
+            for name, (lower, upper) in rules.items():
+                outliers = values[(values < lower) | (values > upper)]
+                found[name]["count"] += len(outliers)
+                room = OUTLIER_MAX_VALUES - len(found[name]["values"])
+                found[name]["values"].extend(outliers.iloc[:max(room, 0)].tolist())
+
+    outliers_info = {}
+    for name, (lower, upper) in rules.items():
+        info = {"outliers_count": found[name]["count"],
+                "outliers_percentage": found[name]["count"] / total * 100,
+                "outlier_values": found[name]["values"]}
+        if name == "iqr_method":
+            info = dict({"lower_bound": lower, "upper_bound": upper, "approximate": True,
+                         "quantile_rank_error": sketch.rank_error()}, **info)
+        else:
+            info = dict({"threshold": 3}, **info)
+        if found[name]["count"] > len(found[name]["values"]):
+            info["outlier_values_truncated"] = True
+        outliers_info[name] = info
+
+    return {
+        "column_analyzed": column_name,
+        "total_values": total,
+        "data_statistics": {
+            "mean": mean,
+            "median": sketch.quantile(0.5),
+            "std": std,
+            "min": float(moments.min[0]),
+            "max": float(moments.max[0])
+        },
+        "outlier_detection_results": outliers_info,
+        "engine": "chunked",
+        "approximations": {"data_statistics.median": {"method": "KLL", "rank_error": sketch.rank_error()}}
+    }
@@ -0,0 +1,83 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : cli.py
+# Time       ：2025/7/11 09:40
+# Author     ：aigonna
+"""
+命令行入口，先加载.env再导入图和工具模块，保证.env中的配置对所有模块生效
+
+用法:
+    python -m cli run --csv "./data/China Automobile Sales Data.csv" --message "对所给csv数据进行分析，生成分析报告"
+    python -m cli batch jobs.jsonl --results output/batch_results.jsonl --concurrency 4
+"""
+import sys
+import argparse
+
+DEFAULT_CSV = "./data/China Automobile Sales Data.csv"
+DEFAULT_MESSAGE = "对所给csv数据进行分析，生成分析报告"
+
+
+def _run(args: argparse.Namespace) -> int:
+    from loguru import logger
+    from graphs import build_graph, make_inputs, arun
+
+    user_message = args.user_message or f"{args.message}，文档路径为{args.csv}"
+    if args.use_async:
+        import asyncio
+        final_state = asyncio.run(arun(user_message, recursion_limit=args.recursion_limit))
+    else:
+        graph = build_graph()
+        final_state = graph.invoke(make_inputs(user_message), {"recursion_limit": args.recursion_limit})
+    logger.info(f"报告任务完成，输出目录: {final_state.get('task_folder')}")
+    return 0
+
+
+def _batch(args: argparse.Namespace) -> int:
+    from batch import run_from_args
+    return run_from_args(args)
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser):
+    """批处理参数定义，batch模块的命令行入口同样复用"""
+    parser.add_argument("jobs", help="JSONL任务文件路径")
+    parser.add_argument("--results", default="output/batch_results.jsonl", help="结果JSONL文件路径")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时运行的任务数")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="LLM并发请求上限")
+    parser.add_argument("--cpu-concurrency", type=int, default=None, help="CPU密集工具并发上限")
+    parser.add_argument("--recursion-limit", type=int, default=100, help="每个任务的LangGraph递归上限")
+    parser.add_argument("--timeout", type=float, default=None, help="单个任务超时时间（秒）")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="LangGraph多分支数据分析报告")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="运行一次数据分析报告任务")
+    run_parser.add_argument("--csv", default=DEFAULT_CSV, help="CSV文件路径")
+    run_parser.add_argument("--message", default=DEFAULT_MESSAGE, help="分析需求，会与CSV路径拼接为用户消息")
+    run_parser.add_argument("--user-message", default=None, help="完整的用户消息，设置后忽略--csv和--message")
+    run_parser.add_argument("--recursion-limit", type=int, default=100, help="LangGraph递归上限")
+    run_parser.add_argument("--async", dest="use_async", action="store_true", help="使用异步图运行")
+    run_parser.set_defaults(func=_run)
+
+    batch_parser = subparsers.add_parser("batch", help="批量运行JSONL中的报告任务")
+    add_batch_arguments(batch_parser)
+    batch_parser.set_defaults(func=_batch)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        # 不带子命令时保持原来的行为：分析示例数据
+        args = parser.parse_args(["run"])
+
+    # 先加载.env，再导入其余模块，.env中的性能配置在模块导入时读取
+    from dotenv import load_dotenv
+    load_dotenv('.env', override=True)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
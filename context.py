@@ -0,0 +1,146 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : context.py
+# Time       ：2025/7/17 11:20
+# Author     ：aigonna
+"""
+execute_node的上下文预算管理
+
+每个步骤的提示词由此前所有步骤的执行总结（observations）加上本步骤工具循环中的消息组成，
+步骤越多、工具结果越大，提示词越长。ContextBudget在每次调用LLM前把消息压到预算以内：
+    1. 超过TOOL_RESULT_MAX_TOKENS的工具结果保存为JSON文件，消息中只保留开头部分和文件路径
+    2. 仍超出CONTEXT_TOKEN_BUDGET时，从最早的执行总结开始压缩为摘要
+    3. 还超出时，从最早的执行总结开始丢弃
+本步骤的系统提示、用户提示以及AI消息与工具消息的对应关系不会被改动。
+"""
+import os
+import re
+import json
+import hashlib
+from loguru import logger
+from langchain_core.messages import ToolMessage
+
+# 每次LLM调用的提示词token预算，0表示不限制
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "32000"))
+# 单条工具结果的token上限，超出时落盘并替换为摘要
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "2000"))
+# 压缩后的执行总结保留的token数
+OBSERVATION_SUMMARY_TOKENS = int(os.getenv("OBSERVATION_SUMMARY_TOKENS", "300"))
+CONTEXT_SPILL_DIR = "context"
+
+_CJK = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+# 每条消息的角色、分隔符等固定开销
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的token估算：中日韩字符按每字1个token，其余字符按每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    tokens = estimate_tokens(content) + _MESSAGE_OVERHEAD_TOKENS
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(tool_call["name"] + json.dumps(tool_call["args"], ensure_ascii=False, default=str))
+    return tokens
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """按估算token数截取文本开头"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+class ContextBudget:
+    """
+    单个步骤的上下文预算，在该步骤的工具循环中每次调用LLM前调用fit
+    :param task_folder: 工具结果落盘的任务文件夹
+    :param n_observations: 消息列表开头属于此前步骤执行总结的消息数
+    :param budget: token预算，默认CONTEXT_TOKEN_BUDGET
+    """
+
+    def __init__(self, task_folder: str, n_observations: int, budget: int = None):
+        self.task_folder = task_folder or ""
+        self.n_observations = n_observations
+        self.budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+        self.tokens_saved = 0
+        self._digested = set()
+        self._compressed = set()
+
+    def _spill(self, message: ToolMessage) -> str:
+        """把完整的工具结果写入任务文件夹下的JSON文件，返回文件路径"""
+        # 文件名取内容摘要而不是tool_call_id，相同结果得到相同路径，不影响LLM缓存和回放的请求键
+        content = message.content.replace(self.task_folder, "") if self.task_folder else message.content
+        name = hashlib.md5(content.encode("utf-8")).hexdigest()[:12]
+        folder = os.path.join(self.task_folder or "output", CONTEXT_SPILL_DIR)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"tool_result_{name}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"tool_call_id": message.tool_call_id, "content": message.content}, f, ensure_ascii=False, indent=2)
+        return path
+
+    def _digest_tool_message(self, message: ToolMessage) -> ToolMessage:
+        original = message_tokens(message)
+        path = self._spill(message)
+        content = (_truncate(message.content, TOOL_RESULT_MAX_TOKENS)
+                   + f"\n...[工具结果过长已截断，原文约{original}tokens，完整结果已保存至 {path}，需要时可用read_file_content读取]")
+        digest = message.model_copy(update={"content": content})
+        self.tokens_saved += original - message_tokens(digest)
+        return digest
+
+    def _compress_observation(self, message):
+        original = message_tokens(message)
+        content = _truncate(message.content, OBSERVATION_SUMMARY_TOKENS) + f"\n...[早期步骤总结已压缩，原文约{original}tokens]"
+        summary = message.model_copy(update={"content": content})
+        saved = original - message_tokens(summary)
+        if saved <= 0:
+            return message, 0
+        return summary, saved
+
+    def fit(self, messages: list) -> list:
+        """返回不超过预算的消息列表，执行总结被丢弃时同步减少n_observations"""
+        if not self.budget:
+            return messages
+        messages = list(messages)
+        for i, message in enumerate(messages):
+            if (isinstance(message, ToolMessage) and id(message) not in self._digested
+                    and message_tokens(message) > TOOL_RESULT_MAX_TOKENS):
+                messages[i] = self._digest_tool_message(message)
+                self._digested.add(id(messages[i]))
+
+        total = sum(message_tokens(message) for message in messages)
+        # 最早的执行总结先压缩，最近的保留原文
+        for i in range(self.n_observations):
+            if total <= self.budget:
+                break
+            if id(messages[i]) in self._compressed:
+                continue
+            messages[i], saved = self._compress_observation(messages[i])
+            self._compressed.add(id(messages[i]))
+            total -= saved
+            self.tokens_saved += saved
+
+        dropped = 0
+        while total > self.budget and dropped < self.n_observations:
+            total -= message_tokens(messages[dropped])
+            self.tokens_saved += message_tokens(messages[dropped])
+            dropped += 1
+        if dropped:
+            messages = messages[dropped:]
+            self.n_observations -= dropped
+            logger.info(f"✂️ 上下文超出预算，丢弃最早的 {dropped} 条执行总结")
+        if total > self.budget:
+            logger.warning(f"⚠️ 压缩后上下文约{total}tokens，仍超出预算{self.budget}")
+        return messages
@@ -0,0 +1,352 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : dataset.py
+# Time       ：2025/7/8 10:12
+# Author     ：aigonna
+import os
+import re
+import json
+import codecs
+import shutil
+import hashlib
+import threading
+import contextlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# 进程内数据集缓存的内存上限（MB），可通过环境变量调整
+DATASET_CACHE_MAX_MB = float(os.getenv("DATASET_CACHE_MAX_MB", "1024"))
+# 列式旁路文件（Feather）目录，设置DATASET_SIDECAR=0可关闭
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", os.path.join("output", ".dataset_cache"))
+DATASET_SIDECAR = os.getenv("DATASET_SIDECAR", "1") != "0"
+# 编码探测只读取文件开头的有限字节
+ENCODING_SAMPLE_BYTES = int(os.getenv("ENCODING_SAMPLE_BYTES", str(1024 * 1024)))
+# gb2312是gbk的子集，在gbk之后永远不会命中，因此以超集gb18030代替
+ENCODING_CANDIDATES = ['utf-8', 'gbk', 'gb18030', 'latin1']
+
+# 加载档案：compact会把低基数字符串列转为category、日期字符串列解析为datetime并压缩数值类型；raw保持read_csv原样
+DATASET_DTYPE_PROFILE = os.getenv("DATASET_DTYPE_PROFILE", "compact")
+# 唯一值占比不超过该比例的字符串列转为category
+CATEGORY_MAX_RATIO = float(os.getenv("CATEGORY_MAX_RATIO", "0.5"))
+# 加载档案的转换规则版本，规则变化时递增，使旧的旁路文件和派生结果失效
+_PROFILE_VERSION = 2
+
+_DATE_PATTERN = re.compile(r'^\d{4}-\d{1,2}(-\d{1,2})?([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+_cache = OrderedDict()  # key -> (DataFrame, nbytes)
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_load_locks = {}
+_encodings = {}  # key -> 实际使用的编码
+_fingerprints = {}  # key -> 文件内容指纹
+# 当前线程通过load_dataframe取得的数据行数，供tracing统计每次工具调用处理的行数
+_rows_counter = threading.local()
+
+
+def dataset_key(file_path: str) -> tuple:
+    """以绝对路径、修改时间和文件大小作为数据集版本标识"""
+    abs_path = os.path.abspath(file_path)
+    stat = os.stat(abs_path)
+    return abs_path, stat.st_mtime_ns, stat.st_size
+
+
+def _encoding_candidates(preferred: str = None) -> list:
+    candidates = [preferred] if preferred else []
+    candidates += [enc for enc in ENCODING_CANDIDATES if codecs.lookup(enc).name not in
+                   {codecs.lookup(c).name for c in candidates}]
+    return candidates
+
+
+def detect_encoding(file_path: str, preferred: str = None) -> str:
+    """
+    只读取文件开头的样本字节探测编码：先识别BOM，再按候选顺序严格解码样本
+    :param file_path: 文件路径
+    :param preferred: 优先尝试的编码
+    :return: 编码名称
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+        at_eof = not f.read(1)
+
+    for bom, enc in _BOMS:
+        if sample.startswith(bom):
+            return enc
+
+    for enc in _encoding_candidates(preferred):
+        try:
+            # 样本末尾可能截断多字节字符，未读完整个文件时允许残留
+            codecs.getincrementaldecoder(enc)(errors='strict').decode(sample, final=at_eof)
+            return enc
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return 'latin1'
+
+
+def _parse_csv(file_path: str, preferred: str = None):
+    """探测编码后只做一次完整解析；样本之外出现非法字节时才退回后续候选编码"""
+    encoding = detect_encoding(file_path, preferred)
+    candidates = [encoding] + [enc for enc in _encoding_candidates(preferred) if enc != encoding]
+    for i, enc in enumerate(candidates):
+        try:
+            df = pd.read_csv(file_path, encoding=enc)
+            if DATASET_DTYPE_PROFILE == "compact":
+                df = compact_dtypes(df)
+            return df, enc
+        except UnicodeDecodeError:
+            if i == len(candidates) - 1:
+                raise
+            logger.warning(f"编码{enc}在样本之外解码失败，尝试下一个候选编码: {file_path}")
+
+
+def _looks_like_dates(col: pd.Series) -> bool:
+    sample = col.dropna().head(1000).astype(str)
+    return not sample.empty and bool(sample.str.match(_DATE_PATTERN).all())
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    紧凑类型档案：日期字符串列解析为datetime，低基数字符串列转为category，
+    整数列向下转换为最小可容纳类型，浮点列只在转为float32无损时向下转换
+    :param df: read_csv得到的原始DataFrame
+    :return: 新的DataFrame
+    """
+    columns = {}
+    for name, col in df.items():
+        if col.dtype == object or pd.api.types.is_string_dtype(col.dtype):
+            if _looks_like_dates(col):
+                parsed = pd.to_datetime(col, errors='coerce', format='ISO8601')
+                # 只有全部非空值都能解析时才转换，避免静默丢数据
+                if parsed.notna().sum() == col.notna().sum():
+                    columns[name] = parsed
+                    continue
+            if col.nunique(dropna=True) <= max(1, int(len(col) * CATEGORY_MAX_RATIO)):
+                columns[name] = col.astype('category')
+                continue
+        elif pd.api.types.is_integer_dtype(col.dtype) and col.dtype != np.uint64:
+            columns[name] = pd.to_numeric(col, downcast='integer')
+            continue
+        elif pd.api.types.is_float_dtype(col.dtype):
+            # 只有转为float32后能无损还原时才向下转换，否则价格等小数在结果中会出现406.29998779296875这样的误差
+            downcast = col.astype('float32')
+            if downcast.astype(col.dtype).equals(col):
+                columns[name] = downcast
+                continue
+        columns[name] = col
+    return pd.DataFrame(columns, index=df.index)
+
+
+def categorical_columns(df: pd.DataFrame) -> list:
+    """返回字符串型和category型列名"""
+    return df.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
+
+
+def _sidecar_path(key: tuple) -> str:
+    """旁路文件路径：<源文件名>_<路径哈希>_<版本哈希>.feather"""
+    abs_path, mtime_ns, size = key
+    path_hash = hashlib.sha1(abs_path.encode('utf-8')).hexdigest()[:12]
+    version_hash = hashlib.sha1(f"{mtime_ns}:{size}:{DATASET_DTYPE_PROFILE}:{_PROFILE_VERSION}".encode('utf-8')).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(abs_path))[0].replace(' ', '_')
+    return os.path.join(os.path.abspath(DATASET_CACHE_DIR), f"{stem}_{path_hash}_{version_hash}.feather")
+
+
+def _read_sidecar(key: tuple):
+    """以内存映射方式读取旁路文件，返回(DataFrame, 编码)，不存在或不可用时返回None"""
+    if not DATASET_SIDECAR:
+        return None
+    path = _sidecar_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        from pyarrow import feather
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            encoding = json.load(f).get("encoding")
+        return feather.read_table(path, memory_map=True).to_pandas(), encoding
+    except Exception as e:
+        logger.warning(f"读取数据集旁路文件失败，回退到解析CSV: {path}, {e}")
+        return None
+
+
+def _write_sidecar(key: tuple, df: pd.DataFrame, encoding: str):
+    """将解析好的DataFrame写成未压缩Feather，便于后续进程直接内存映射"""
+    if not DATASET_SIDECAR:
+        return
+    path = _sidecar_path(key)
+    try:
+        from pyarrow import feather
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 清理同一源文件的旧版本旁路文件，以及旧版本的派生结果目录（<旁路文件名>.artifacts，见artifacts.py）
+        prefix = path.rsplit('_', 1)[0] + '_'
+        current = os.path.splitext(path)[0]
+        for name in os.listdir(os.path.dirname(path)):
+            old_path = os.path.join(os.path.dirname(path), name)
+            if not old_path.startswith(prefix) or old_path.startswith(current):
+                continue
+            if os.path.isdir(old_path):
+                shutil.rmtree(old_path, ignore_errors=True)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(old_path)
+        # 先写临时文件再原子替换，避免并发进程读到半成品
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        feather.write_feather(df, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+        with open(f"{path}.json", 'w', encoding='utf-8') as f:
+            json.dump({"source": key[0], "mtime_ns": key[1], "size": key[2], "encoding": encoding}, f,
+                      ensure_ascii=False, indent=2)
+    except ImportError:
+        logger.debug("未安装pyarrow，跳过数据集旁路文件")
+    except Exception as e:
+        logger.warning(f"写入数据集旁路文件失败: {path}, {e}")
+
+
+def _evict(max_bytes: int):
+    """按LRU顺序淘汰缓存，直到总占用不超过上限"""
+    global _cache_bytes
+    while _cache and _cache_bytes > max_bytes:
+        _, (_, nbytes) = _cache.popitem(last=False)
+        _cache_bytes -= nbytes
+
+
+def reset_rows_processed():
+    _rows_counter.value = 0
+
+
+def rows_processed() -> int:
+    return getattr(_rows_counter, "value", 0)
+
+
+def add_rows_processed(rows: int):
+    """累计当前线程处理的数据行数，分块读取时每块调用一次"""
+    _rows_counter.value = rows_processed() + rows
+
+
+def load_dataframe(file_path: str, encoding: str = None) -> pd.DataFrame:
+    """
+    通过进程内LRU缓存读取CSV，同一文件版本只解析一次
+    进程缓存未命中时优先内存映射磁盘上的Feather旁路文件，新进程无需重新解析文本
+    解析后按DATASET_DTYPE_PROFILE压缩列类型，所有工具拿到的都是同一份紧凑DataFrame
+    返回的DataFrame为共享对象，调用方不应原地修改；返回的行数会累计到当前线程的rows_processed()
+    :param file_path: CSV文件路径
+    :param encoding: 缓存未命中时优先尝试的编码，默认自动探测
+    :return: DataFrame
+    """
+    df = _load_dataframe(file_path, encoding)
+    add_rows_processed(len(df))
+    return df
+
+
+def _load_dataframe(file_path: str, encoding: str = None) -> pd.DataFrame:
+    """load_dataframe的实现，不统计行数"""
+    global _cache_bytes
+    key = dataset_key(file_path)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key][0]
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # 同一文件并发读取时只解析一次，其余调用等待结果
+    with load_lock:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key][0]
+
+        try:
+            cached = _read_sidecar(key)
+            if cached is None:
+                df, encoding = _parse_csv(key[0], encoding)
+                _write_sidecar(key, df, encoding)
+            else:
+                df, encoding = cached
+        except Exception:
+            with _cache_lock:
+                _load_locks.pop(key, None)
+            raise
+        nbytes = int(df.memory_usage(deep=True).sum())
+        max_bytes = int(DATASET_CACHE_MAX_MB * 1024 * 1024)
+
+        with _cache_lock:
+            _load_locks.pop(key, None)
+            # 旧版本文件的缓存直接丢弃
+            for stale in [k for k in _cache if k[0] == key[0]]:
+                _cache_bytes -= _cache.pop(stale)[1]
+                _encodings.pop(stale, None)
+            _encodings[key] = encoding
+            if nbytes <= max_bytes:
+                _cache[key] = (df, nbytes)
+                _cache_bytes += nbytes
+                _evict(max_bytes)
+        return df
+
+
+def dataset_encoding(file_path: str) -> str:
+    """返回数据集实际使用的编码，尚未加载时先加载一次"""
+    key = dataset_key(file_path)
+    with _cache_lock:
+        if key in _encodings:
+            return _encodings[key]
+    load_dataframe(file_path)
+    with _cache_lock:
+        return _encodings.get(key) or detect_encoding(key[0])
+
+
+def dataset_columns(file_path: str) -> list:
+    """返回数据集的列名；已在进程缓存中时直接取，否则只读取表头"""
+    key = dataset_key(file_path)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key][0].columns.tolist()
+    encoding = _encodings.get(key) or detect_encoding(key[0])
+    return pd.read_csv(key[0], encoding=encoding, nrows=0).columns.tolist()
+
+
+def dataset_fingerprint(file_path: str) -> str:
+    """
+    数据集内容指纹（文件内容的blake2b摘要），内容相同的文件得到相同指纹
+    同一文件版本只计算一次；开启旁路文件时记录在DATASET_CACHE_DIR中，其他进程直接复用
+    """
+    key = dataset_key(file_path)
+    with _cache_lock:
+        if key in _fingerprints:
+            return _fingerprints[key]
+    record_path = f"{_sidecar_path(key)}.fingerprint"
+    fingerprint = None
+    if DATASET_SIDECAR and os.path.exists(record_path):
+        with open(record_path, 'r', encoding='utf-8') as f:
+            fingerprint = f.read().strip() or None
+    if fingerprint is None:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(key[0], 'rb') as f:
+            for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()
+        if DATASET_SIDECAR:
+            try:
+                os.makedirs(os.path.dirname(record_path), exist_ok=True)
+                with open(record_path, 'w', encoding='utf-8') as f:
+                    f.write(fingerprint)
+            except OSError as e:
+                logger.warning(f"写入数据集指纹失败: {record_path}, {e}")
+    with _cache_lock:
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+def clear_dataset_cache():
+    """清空进程内数据集缓存"""
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _encodings.clear()
+        _fingerprints.clear()
+        _cache_bytes = 0
@@ -6,18 +6,23 @@
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
 from state import State
-from nodes import (report_node, execute_node, create_planner_node)
+from nodes import (report_node, execute_node, join_node, create_planner_node,
+                   areport_node, aexecute_node, acreate_planner_node)
 
 
-def _build_base_graph() -> StateGraph:
+def _build_base_graph(use_async: bool = False) -> StateGraph:
     """
     Build and return the base state graph with all nodes and edges.
+    :param use_async: 使用ainvoke版本的节点，供事件循环中并发运行多个报告任务
     """
     builder = StateGraph(State)
     builder.add_edge(START, 'create_planner')
-    builder.add_node('create_planner', create_planner_node)
-    builder.add_node('execute', execute_node)
-    builder.add_node('report', report_node)
+    builder.add_node('create_planner', acreate_planner_node if use_async else create_planner_node)
+    builder.add_node('execute', aexecute_node if use_async else execute_node)
+    # 同一批并行执行的步骤在join处汇合，再决定分发下一批步骤还是生成报告
+    builder.add_node('join', join_node)
+    builder.add_edge('execute', 'join')
+    builder.add_node('report', areport_node if use_async else report_node)
     builder.add_edge("report", END)
     return builder
 
@@ -32,12 +37,42 @@ def build_graph():
     builder = _build_base_graph()
     return builder.compile()
 
+def build_async_graph():
+    """Build and return the async agent workflow graph (use with ainvoke)."""
+    builder = _build_base_graph(use_async=True)
+    return builder.compile()
+
+
+def make_inputs(user_message: str, task_folder: str = "") -> dict:
+    """构造一次报告任务的初始状态，task_folder为空时由planner创建"""
+    return {"user_message": user_message,
+            "plan": None,
+            "observations": [],
+            "final_report": "",
+            "task_folder": task_folder,
+            "trace": []}
+
+
+_async_graph = None
+
+
+async def arun(user_message: str, recursion_limit: int = 100, task_folder: str = "") -> dict:
+    """
+    异步运行一次完整的报告任务，同一个事件循环中可以并发调用多次
+    :param user_message: 用户消息
+    :param recursion_limit: LangGraph递归上限
+    :param task_folder: 预先创建的任务文件夹（可选）
+    :return: 最终状态
+    """
+    global _async_graph
+    if _async_graph is None:
+        _async_graph = build_async_graph()
+    return await _async_graph.ainvoke(make_inputs(user_message, task_folder), {"recursion_limit": recursion_limit})
 
-graph = build_graph()
-inputs = {"user_message": "对所给csv数据进行分析，生成分析报告，文档路径为./data/China Automobile Sales Data.csv",
-          "plan": None,
-          "observations": [],
-          "final_report": "",
-          "task_folder": ""}
 
-graph.invoke(inputs, {"recursion_limit":100})
\ No newline at end of file
+# 图表工具在spawn进程池中执行，子进程会重新导入主模块，运行入口必须放在__main__保护之下
+if __name__ == "__main__":
+    # 保持python graphs.py的用法，命令行参数与python -m cli一致
+    import sys
+    from cli import main
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : groupby_engine.py
+# Time       ：2025/7/24 10:26
+# Author     ：aigonna
+"""
+分组聚合的执行后端，供category_analysis和trend_analysis使用
+
+    - pandas：单线程df.groupby(by, observed=True)[value].agg(aggs)
+    - partitioned：按分组键的哈希把行分到GROUPBY_WORKERS个分区，每个分区在线程池中独立做pandas分组聚合
+      （哈希、排序、取行和聚合内核都释放GIL），再按键排序拼接。同一组的所有行落在同一分区且保持原有顺序，
+      因此每组的结果与单线程pandas逐位相同
+    - duckdb：在DuckDB中执行GROUP BY（需安装duckdb，多核向量化执行）；整数求和、计数、最小/最大值与pandas相同，
+      均值和标准差在浮点舍入范围内一致
+
+默认使用pandas。partitioned和duckdb需要通过GROUPBY_BACKEND显式选择：partitioned的分区开销约等于一次单线程聚合，
+只有在多核机器上才可能更快，启用前先用benchmarks/bench_groupby.py在目标机器上确认加速比。
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+GROUPBY_BACKEND = os.getenv("GROUPBY_BACKEND", "pandas")
+GROUPBY_WORKERS = int(os.getenv("GROUPBY_WORKERS", "0")) or os.cpu_count() or 1
+BACKENDS = ("pandas", "partitioned", "duckdb")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_DUCKDB_AGGREGATES = {"sum": "sum", "mean": "avg", "count": "count", "std": "stddev_samp", "min": "min", "max": "max"}
+
+
+def resolve_backend(backend: str = None) -> str:
+    backend = backend or GROUPBY_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的分组聚合后端: {backend}，可选: {BACKENDS}")
+    return backend
+
+
+def _pandas_agg(df: pd.DataFrame, by: list, value_column: str, aggs: list) -> pd.DataFrame:
+    return df.groupby(by, observed=True)[value_column].agg(aggs)
+
+
+def _partition_ids(df: pd.DataFrame, by: list, partitions: int) -> np.ndarray:
+    """分区号只取决于分组键；category列直接用编码，其他列用pandas哈希"""
+    # 分区号用最小的整数类型，稳定排序时numpy对8/16位整数使用基数排序
+    dtype = np.uint8 if partitions <= 256 else np.uint16
+    if len(by) == 1 and isinstance(df[by[0]].dtype, pd.CategoricalDtype):
+        return (df[by[0]].cat.codes.to_numpy() % partitions).astype(dtype)
+    hashes = pd.util.hash_pandas_object(df[by], index=False).to_numpy()
+    return (hashes % np.uint64(partitions)).astype(dtype)
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    """partitioned后端共用的线程池，多个工具并发调用时只创建一个"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=GROUPBY_WORKERS, thread_name_prefix="groupby")
+        return _pool
+
+
+def set_workers(workers: int):
+    """修改partitioned后端的线程数（基准测试用），关闭已有线程池，下次使用时按新线程数重建"""
+    global GROUPBY_WORKERS, _pool
+    with _pool_lock:
+        GROUPBY_WORKERS, pool, _pool = workers, _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def _split_rows(frame: pd.DataFrame, by: list, start: int, stop: int, partitions: int) -> list:
+    """把[start, stop)行按分区号拆成partitions组行号，稳定排序保证组内保持原有顺序"""
+    partition = _partition_ids(frame.iloc[start:stop], by, partitions)
+    order = np.argsort(partition, kind='stable') + start
+    bounds = np.cumsum(np.bincount(partition, minlength=partitions))[:-1]
+    return np.split(order, bounds)
+
+
+def _partitioned_agg(df: pd.DataFrame, by: list, value_column: str, aggs: list) -> pd.DataFrame:
+    frame = df[by + [value_column]]
+    pool, partitions = _get_pool(), GROUPBY_WORKERS
+    # 第一步：各线程处理一段连续的行，计算分区号并拆分行号
+    edges = np.linspace(0, len(frame), partitions + 1).astype(np.int64)
+    pieces = list(pool.map(lambda i: _split_rows(frame, by, edges[i], edges[i + 1], partitions), range(partitions)))
+
+    # 第二步：各线程按原有行顺序取出一个分区的行并聚合，每组的行与顺序都与单线程相同，结果逐位一致
+    def aggregate(partition: int):
+        rows = np.concatenate([piece[partition] for piece in pieces])
+        return _pandas_agg(frame.take(rows), by, value_column, aggs) if len(rows) else None
+
+    results = [result for result in pool.map(aggregate, range(partitions)) if result is not None]
+    return pd.concat(results).sort_index()
+
+
+def _duckdb_agg(df: pd.DataFrame, by: list, value_column: str, aggs: list) -> pd.DataFrame:
+    import duckdb
+
+    frame = df[by + [value_column]]
+    values = frame[value_column]
+    integer = pd.api.types.is_integer_dtype(values.dtype)
+    keys = ", ".join(f'"{name}"' for name in by)
+    selects = []
+    for agg in aggs:
+        expression = f'{_DUCKDB_AGGREGATES[agg]}("{value_column}")'
+        if agg == "sum" and integer:
+            expression = f"CAST({expression} AS BIGINT)"
+        selects.append(f'{expression} AS "{agg}"')
+    not_null = " AND ".join(f'"{name}" IS NOT NULL' for name in by)
+    sql = f'SELECT {keys}, {", ".join(selects)} FROM frame WHERE {not_null} GROUP BY {keys}'
+    with duckdb.connect() as con:
+        con.register("frame", frame)
+        result = con.execute(sql).df()
+    # 还原与pandas一致的键类型、结果类型和排序
+    for name in by:
+        result[name] = result[name].astype(frame[name].dtype)
+    for agg in aggs:
+        if agg == "sum":
+            # 全为空值的组，pandas求和为0，SQL为NULL
+            result[agg] = result[agg].fillna(0)
+        # pandas：计数为int64；整数求和为int64，但结果能放回原类型时保持原类型；
+        # 整数的均值和标准差为float64，其余保持原类型（如float32）
+        if agg == "count":
+            result[agg] = result[agg].astype('int64')
+        elif agg == "sum" and integer:
+            info = np.iinfo(values.dtype)
+            fits = result[agg].between(info.min, info.max).all()
+            result[agg] = result[agg].astype(values.dtype if fits else 'int64')
+        elif agg in ("min", "max") or not integer:
+            result[agg] = result[agg].astype(values.dtype)
+    return result.set_index(by).sort_index()
+
+
+def groupby_agg(df: pd.DataFrame, by, value_column: str, aggs, backend: str = None) -> pd.DataFrame:
+    """
+    等价于df.groupby(by, observed=True)[value_column].agg(aggs).reset_index()
+    :param by: 分组列名或列名列表
+    :param aggs: 聚合函数名，支持sum、mean、count、std、min、max
+    :param backend: 后端，默认GROUPBY_BACKEND
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    aggs = list(aggs)
+    backend = resolve_backend(backend)
+    if backend == "partitioned":
+        result = _partitioned_agg(df, by, value_column, aggs)
+    elif backend == "duckdb":
+        result = _duckdb_agg(df, by, value_column, aggs)
+    else:
+        result = _pandas_agg(df, by, value_column, aggs)
+    return result.reset_index()
@@ -0,0 +1,186 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : llm_cache.py
+# Time       ：2025/7/14 10:18
+# Author     ：aigonna
+"""
+LLM响应的磁盘缓存（SQLite），默认关闭，设置环境变量LLM_CACHE=1开启
+
+缓存键由模型名、温度、绑定工具的schema以及规范化后的消息组成。规范化时会去掉
+tool_call id，并把本次任务文件夹路径替换为占位符，同一CSV和同一用户消息的重复运行
+可以命中缓存；读取时再把占位符还原为当前任务文件夹。
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from loguru import logger
+
+# 缓存配置在首次使用时读取（.env在构建LLM时才加载）：
+#   LLM_CACHE_PATH 缓存文件路径；LLM_CACHE_TTL 过期时间（秒，0表示永不过期）；LLM_CACHE_MAX_MB 缓存总大小上限
+DEFAULT_LLM_CACHE_PATH = os.path.join("output", ".llm_cache.sqlite")
+DEFAULT_LLM_CACHE_TTL = 7 * 24 * 3600
+DEFAULT_LLM_CACHE_MAX_MB = 256
+
+TASK_FOLDER_PLACEHOLDER = "<<TASK_FOLDER>>"
+
+
+def _task_folder_variants(task_folder: str) -> list:
+    """任务文件夹可能以绝对路径或相对路径出现在消息中，先替换更长的绝对路径"""
+    if not task_folder:
+        return []
+    return [os.path.join(os.getcwd(), task_folder), task_folder]
+
+
+def _json_escaped(text: str) -> str:
+    return json.dumps(text, ensure_ascii=False)[1:-1]
+
+
+def mask_task_folder(text: str, task_folder: str, in_json: bool = False) -> str:
+    """把任务文件夹路径替换为占位符；in_json为True时按JSON转义后的形式匹配"""
+    for variant in _task_folder_variants(task_folder):
+        text = text.replace(_json_escaped(variant) if in_json else variant, TASK_FOLDER_PLACEHOLDER)
+    return text
+
+
+def unmask_task_folder(text: str, task_folder: str, in_json: bool = False) -> str:
+    if not task_folder:
+        return text
+    return text.replace(TASK_FOLDER_PLACEHOLDER, _json_escaped(task_folder) if in_json else task_folder)
+
+
+def normalize_messages(messages: list, task_folder: str = "") -> list:
+    """把消息规范化为可稳定序列化的结构，去掉每次运行都会变化的tool_call id和任务文件夹"""
+    normalized = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False, sort_keys=True, default=str)
+        item = {"type": message.type, "content": mask_task_folder(content, task_folder)}
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            item["tool_calls"] = [{"name": call["name"],
+                                   "args": mask_task_folder(json.dumps(call["args"], ensure_ascii=False, sort_keys=True, default=str), task_folder, in_json=True)}
+                                  for call in tool_calls]
+        normalized.append(item)
+    return normalized
+
+
+def tool_schemas(tools: list) -> list:
+    """绑定工具的OpenAI格式schema，工具定义变化时缓存自动失效"""
+    if not tools:
+        return []
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+    return [convert_to_openai_tool(tool) for tool in tools]
+
+
+def request_key(messages: list, tools: list = None, task_folder: str = "", **params) -> str:
+    """
+    计算一次LLM请求的缓存键
+    :param messages: 发送给模型的消息
+    :param tools: 绑定的工具
+    :param task_folder: 当前任务文件夹，会被替换为占位符
+    :param params: 其他影响输出的参数，例如model、temperature
+    :return: sha256十六进制摘要
+    """
+    payload = {"params": params, "tools": tool_schemas(tools),
+               "messages": normalize_messages(messages, task_folder)}
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """基于SQLite的LLM响应缓存，支持TTL过期和按总大小的LRU淘汰，可被多线程/多进程共享"""
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, ttl: float = DEFAULT_LLM_CACHE_TTL,
+                 max_mb: float = DEFAULT_LLM_CACHE_MAX_MB):
+        self.path = os.path.abspath(path)
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                                key TEXT PRIMARY KEY,
+                                model TEXT,
+                                response TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                created_at REAL NOT NULL,
+                                accessed_at REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # 每次操作使用独立连接并在结束时提交、关闭，避免跨线程共享连接
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, llm, messages: list, tools: list = None, task_folder: str = "") -> str:
+        return request_key(messages, tools, task_folder,
+                           model=getattr(llm, "model", None) or getattr(llm, "model_name", None),
+                           temperature=getattr(llm, "temperature", None))
+
+    def get(self, key: str, task_folder: str = ""):
+        """命中时返回响应字典（已还原任务文件夹），未命中或已过期返回None"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(unmask_task_folder(response, task_folder, in_json=True))
+
+    def set(self, key: str, response: dict, task_folder: str = "", model: str = None):
+        raw = mask_task_folder(json.dumps(response, ensure_ascii=False, default=str), task_folder, in_json=True)
+        size = len(raw.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, accessed_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (key, model, raw, size, now, now))
+            if self.ttl:
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """总大小超过上限时，按最近访问时间从旧到新淘汰"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """LLM_CACHE=1时返回进程内共享的LLMCache，否则返回None"""
+    global _cache
+    if os.getenv("LLM_CACHE", "0") != "1":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(path=os.getenv("LLM_CACHE_PATH", DEFAULT_LLM_CACHE_PATH),
+                              ttl=float(os.getenv("LLM_CACHE_TTL", str(DEFAULT_LLM_CACHE_TTL))),
+                              max_mb=float(os.getenv("LLM_CACHE_MAX_MB", str(DEFAULT_LLM_CACHE_MAX_MB))))
+            logger.info(f"🗄️ LLM响应缓存已开启: {_cache.path}")
+        return _cache
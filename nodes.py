@@ -5,27 +5,49 @@
 # Author     ：aigonna
 import os
 import json
+import time
+import asyncio
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from typing import Annotated, Literal
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
-from langgraph.types import Command, interrupt
-from langchain_community.chat_models import ChatLiteLLM
-from state import State
+from langgraph.types import Command, Send, interrupt
+from state import State, StepState
 from prompts import (PLAN_SYSTEM_PROMPT, PLAN_CREATE_PROMPT,
                      EXECUTE_SYSTEM_PROMPT, EXECUTION_PROMPT, REPORT_SYSTEM_PROMPT)
 from tools import (create_file, create_task_folder, send_messages, shell_exec, str_replace,
                    read_csv_data, data_statistics_analysis, create_visualization, trend_analysis,
-                   category_analysis, correlation_analysis, outlier_detection, data_export,
+                   category_analysis, correlation_analysis, outlier_detection, sql_query, data_export,
                    read_file_content, list_files)
+from llm_cache import get_llm_cache
+from replay import ReplayChatModel, get_recorder, task_folder_scope
+from context import ContextBudget
+from shaping import shape_result
+from tracing import node_span, add_span, measured_call, token_usage, export_trace, summarize
 from dotenv import load_dotenv
 
-# 强制加载.env文件
-load_dotenv('.env', override=True)
-logger.info(f"🔧 环境变量加载完成，GOOGLE_API_KEY: {'已设置' if os.getenv('GOOGLE_API_KEY') else '未设置'}")
+_env_loaded = False
+
+
+def load_env():
+    """强制加载.env文件（只执行一次）；由CLI入口和首次使用LLM时调用，导入模块本身不产生副作用"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    load_dotenv('.env', override=True)
+    _env_loaded = True
+    logger.info(f"🔧 环境变量加载完成，GOOGLE_API_KEY: {'已设置' if os.getenv('GOOGLE_API_KEY') else '未设置'}")
+
 
 # LLM配置 - 使用 LiteLLM 统一适配
 def get_llm():
-    """获取LLM实例，使用LiteLLM统一适配多个模型"""
+    """获取LLM实例，使用LiteLLM统一适配多个模型；设置LLM_REPLAY时返回回放录制响应的本地模型"""
+    if os.getenv("LLM_REPLAY"):
+        return ReplayChatModel(transcript_path=os.getenv("LLM_REPLAY"))
+
+    from langchain_community.chat_models import ChatLiteLLM
     
     # 从环境变量获取模型配置
     model_name = os.getenv("MODEL_NAME", "gemini/gemini-2.0-flash-exp")  # 恢复使用Gemini
@@ -91,16 +113,232 @@ def get_llm():
         )
         return fallback_llm
 
-llm = get_llm()
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_shared_llm():
+    """首次使用时加载.env并构建共享的LLM实例，之后直接复用"""
+    global _llm
+    with _llm_lock:
+        if _llm is not None:
+            return _llm
+        load_env()
+        _llm = get_llm()
+
+        # 打印当前配置
+        logger.info(f"🤖 当前模型: {os.getenv('MODEL_NAME', 'gemini/gemini-2.0-flash-exp')}")
+        logger.info(f"🌡️  温度设置: {os.getenv('TEMPERATURE', '0.1')}")
+        logger.info(f"📝 最大Token: {os.getenv('MAX_TOKENS', '128000')}")
+        if os.getenv('GOOGLE_API_KEY') and "gemini" in os.getenv('MODEL_NAME', 'gemini/gemini-2.0-flash-exp'):
+            logger.info(f"🔑 Gemini API配置: 已设置")
+        elif os.getenv('OPENAI_BASE_URL') or os.getenv('openai_base_url'):
+            logger.info(f"🌐 API地址: {os.getenv('OPENAI_BASE_URL', os.getenv('openai_base_url'))}")
+        return _llm
+
+# 同一次LLM响应中多个工具调用的并发上限
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", str(min(8, os.cpu_count() or 1))))
+# 只读的分析工具之间相互独立，可以并发执行；写文件/执行shell的工具作为屏障按原顺序串行执行
+PARALLEL_SAFE_TOOLS = {
+    'read_csv_data', 'data_statistics_analysis', 'create_visualization', 'trend_analysis',
+    'category_analysis', 'correlation_analysis', 'outlier_detection', 'sql_query', 'read_file_content', 'list_files'
+}
+
+# 执行节点可用工具
+EXECUTE_TOOLS = {
+    "create_file": create_file, "str_replace": str_replace, "shell_exec": shell_exec,
+    "read_csv_data": read_csv_data, "data_statistics_analysis": data_statistics_analysis,
+    "create_visualization": create_visualization, "trend_analysis": trend_analysis,
+    "category_analysis": category_analysis, "correlation_analysis": correlation_analysis,
+    "outlier_detection": outlier_detection, "sql_query": sql_query, "data_export": data_export,
+    "read_file_content": read_file_content, "list_files": list_files
+}
+# 为所有需要task_folder的工具自动添加task_folder参数
+EXECUTE_TOOLS_NEED_TASK_FOLDER = [
+    'create_file', 'data_statistics_analysis', 'create_visualization',
+    'trend_analysis', 'category_analysis', 'correlation_analysis',
+    'outlier_detection', 'sql_query', 'data_export', 'read_file_content', 'list_files'
+]
+# 报告生成所需工具
+REPORT_TOOLS = {
+    "create_file": create_file, "shell_exec": shell_exec,
+    "data_export": data_export, "read_file_content": read_file_content,
+    "list_files": list_files
+}
+REPORT_TOOLS_NEED_TASK_FOLDER = [
+    'create_file', 'data_export', 'read_file_content', 'list_files'
+]
+
+_pool_lock = threading.Lock()
+_thread_pool = None
+# 异步路径的全局并发限制（LLM请求数 / CPU密集工具数），由批处理等调用方设置，None表示不限制
+_llm_semaphore = None
+_tool_semaphore = None
+
+
+def set_concurrency_limits(llm_concurrency: int = None, tool_concurrency: int = None):
+    """
+    设置异步节点的并发上限，需在运行任务的事件循环中调用
+    :param llm_concurrency: 同时进行的LLM请求数上限
+    :param tool_concurrency: 同时执行的CPU密集工具数上限
+    """
+    global _llm_semaphore, _tool_semaphore
+    _llm_semaphore = asyncio.Semaphore(llm_concurrency) if llm_concurrency else None
+    _tool_semaphore = asyncio.Semaphore(tool_concurrency) if tool_concurrency else None
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+        return _thread_pool
+
+
+def _invoke_tool(tools: dict, tool_name: str, tool_args: dict):
+    """执行工具并测量耗时，返回(结果, 指标)；图表工具内部提交到charts的渲染进程池"""
+    return measured_call(tools[tool_name].invoke, tool_args)
+
+
+async def _ainvoke_tool(tools: dict, tool_name: str, tool_args: dict):
+    """异步执行工具：pandas/matplotlib等CPU密集工作放到线程池，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    semaphore = _tool_semaphore
+    if semaphore is None:
+        return await loop.run_in_executor(_get_thread_pool(), measured_call, tools[tool_name].invoke, tool_args)
+    await semaphore.acquire()
+    future = loop.run_in_executor(_get_thread_pool(), measured_call, tools[tool_name].invoke, tool_args)
+    # 名额在线程真正结束时才释放：任务超时被取消时线程仍在运行，不能提前让出CPU并发名额
+    future.add_done_callback(lambda _: semaphore.release())
+    return await asyncio.shield(future)
+
+
+def _prepare_tool_calls(tool_calls: list, tools_need_task_folder: list, task_folder: str) -> list:
+    calls = []
+    for tool_call in tool_calls:
+        tool_args = tool_call['args']
+        # 为所有需要task_folder的工具自动添加task_folder参数
+        if tool_call['name'] in tools_need_task_folder and task_folder:
+            tool_args['task_folder'] = task_folder
+        calls.append((tool_call['name'], tool_args))
+    return calls
+
+
+def _tool_batches(calls: list):
+    """把工具调用切分为批次：连续的只读工具合并为一个可并发批次，其余工具单独成批"""
+    batch = []
+    for i, (tool_name, _) in enumerate(calls):
+        if tool_name in PARALLEL_SAFE_TOOLS:
+            batch.append(i)
+            continue
+        if batch:
+            yield batch
+            batch = []
+        yield [i]
+    if batch:
+        yield batch
+
+
+def _tool_messages(tool_calls: list, calls: list, outcomes: list, task_folder: str) -> list:
+    tool_messages = []
+    for tool_call, (tool_name, tool_args), (tool_result, metrics) in zip(tool_calls, calls, outcomes):
+        add_span(tool_name, "tool", metrics.pop("start_ns"), metrics.pop("end_ns"), **metrics)
+        # 过大的结果落盘，返回给LLM的只是有上限的摘要
+        tool_result = shape_result(tool_name, tool_result, task_folder)
+        logger.info(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
+        tool_messages.append(ToolMessage(content=f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}", tool_call_id=tool_call['id']))
+    return tool_messages
+
+
+def _run_tool_calls(tool_calls: list, tools: dict, tools_need_task_folder: list, task_folder: str) -> list:
+    """
+    执行一次LLM响应中的全部工具调用，返回按tool_calls顺序排列的ToolMessage
+    连续的只读分析工具在有界线程池中并发执行，其余工具按原顺序串行执行
+    """
+    calls = _prepare_tool_calls(tool_calls, tools_need_task_folder, task_folder)
+    results = [None] * len(calls)
+    for batch in _tool_batches(calls):
+        if len(batch) == 1:
+            results[batch[0]] = _invoke_tool(tools, *calls[batch[0]])
+            continue
+        futures = {i: _get_thread_pool().submit(_invoke_tool, tools, *calls[i]) for i in batch}
+        for i, future in futures.items():
+            results[i] = future.result()
+    return _tool_messages(tool_calls, calls, results, task_folder)
+
+
+async def _arun_tool_calls(tool_calls: list, tools: dict, tools_need_task_folder: list, task_folder: str) -> list:
+    """_run_tool_calls的异步版本，同一批次的工具通过asyncio.gather并发执行"""
+    calls = _prepare_tool_calls(tool_calls, tools_need_task_folder, task_folder)
+    results = [None] * len(calls)
+    for batch in _tool_batches(calls):
+        batch_results = await asyncio.gather(*[_ainvoke_tool(tools, *calls[i]) for i in batch])
+        for i, tool_result in zip(batch, batch_results):
+            results[i] = tool_result
+    return _tool_messages(tool_calls, calls, results, task_folder)
+
+
+def _cache_lookup(llm, messages: list, tools: dict, task_folder: str):
+    """开启LLM缓存时返回(cache, key, 命中的响应)，未开启时返回(None, None, None)"""
+    cache = get_llm_cache()
+    if cache is None:
+        return None, None, None
+    key = cache.key(llm, messages, list(tools.values()) if tools else None, task_folder)
+    cached = cache.get(key, task_folder)
+    if cached is not None:
+        logger.info(f"🗄️ LLM缓存命中: {key[:12]}")
+    return cache, key, cached
+
+
+def _record_response(messages: list, tools: dict, task_folder: str, response: dict):
+    """设置LLM_RECORD时把响应追加到录制文件，供LLM_REPLAY离线回放"""
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.record(messages, list(tools.values()) if tools else None, task_folder, response)
+
+
+def _trace_llm(llm, start_ns: int, messages: list, tools: dict, response: dict, cached: bool):
+    add_span("llm", "llm", start_ns, time.time_ns(), model=getattr(llm, "model", None), cached=cached,
+             messages=len(messages), bound_tools=len(tools) if tools else 0, tool_calls=len(response.get('tool_calls') or []),
+             **token_usage(response))
+
+
+def _call_llm(messages: list, tools: dict = None, task_folder: str = "") -> dict:
+    """调用LLM（可绑定工具），返回model_dump后的响应字典；开启LLM_CACHE时优先读取磁盘缓存"""
+    llm = get_shared_llm()
+    start_ns = time.time_ns()
+    cache, key, response = _cache_lookup(llm, messages, tools, task_folder)
+    cached = response is not None
+    if not cached:
+        runnable = llm.bind_tools(list(tools.values())) if tools else llm
+        with task_folder_scope(task_folder):
+            response = runnable.invoke(messages)
+        response = json.loads(response.model_dump_json(indent=4, exclude_none=True))
+        if cache is not None:
+            cache.set(key, response, task_folder, model=getattr(llm, "model", None))
+    _trace_llm(llm, start_ns, messages, tools, response, cached)
+    _record_response(messages, tools, task_folder, response)
+    return response
+
+
+async def _acall_llm(messages: list, tools: dict = None, task_folder: str = "") -> dict:
+    """_call_llm的异步版本"""
+    llm = get_shared_llm()
+    start_ns = time.time_ns()
+    cache, key, response = _cache_lookup(llm, messages, tools, task_folder)
+    cached = response is not None
+    if not cached:
+        runnable = llm.bind_tools(list(tools.values())) if tools else llm
+        async with _llm_semaphore or contextlib.nullcontext():
+            with task_folder_scope(task_folder):
+                response = await runnable.ainvoke(messages)
+        response = json.loads(response.model_dump_json(indent=4, exclude_none=True))
+        if cache is not None:
+            cache.set(key, response, task_folder, model=getattr(llm, "model", None))
+    _trace_llm(llm, start_ns, messages, tools, response, cached)
+    _record_response(messages, tools, task_folder, response)
+    return response
 
-# 打印当前配置
-logger.info(f"🤖 当前模型: {os.getenv('MODEL_NAME', 'gemini/gemini-2.0-flash-exp')}")
-logger.info(f"🌡️  温度设置: {os.getenv('TEMPERATURE', '0.1')}")
-logger.info(f"📝 最大Token: {os.getenv('MAX_TOKENS', '128000')}")
-if os.getenv('GOOGLE_API_KEY') and "gemini" in os.getenv('MODEL_NAME', 'gemini/gemini-2.0-flash-exp'):
-    logger.info(f"🔑 Gemini API配置: 已设置")
-elif os.getenv('OPENAI_BASE_URL') or os.getenv('openai_base_url'):
-    logger.info(f"🌐 API地址: {os.getenv('OPENAI_BASE_URL', os.getenv('openai_base_url'))}")
 
 def extract_json(text):
     if '```json' not in text:
@@ -111,166 +349,201 @@ def extract_json(text):
 def extract_answer(text):
     return text
 
+def _normalize_plan(plan: dict) -> dict:
+    """补全步骤id与依赖：未声明depends_on的步骤默认依赖前一步，保持原有的串行语义"""
+    steps = plan.get('steps') or []
+    ids = []
+    for i, step in enumerate(steps):
+        step['id'] = str(step.get('id') or i + 1)
+        step.setdefault('status', 'pending')
+        ids.append(step['id'])
+    for i, step in enumerate(steps):
+        if 'depends_on' not in step:
+            step['depends_on'] = [ids[i - 1]] if i > 0 else []
+        # 忽略未知id和自身依赖
+        step['depends_on'] = [str(dep) for dep in step['depends_on'] if str(dep) in ids and str(dep) != step['id']]
+    plan['steps'] = steps
+    return plan
+
+
+def _ready_steps(plan: dict) -> list:
+    """返回依赖已全部完成的待执行步骤；存在循环依赖时退化为执行第一个待执行步骤"""
+    steps = plan['steps']
+    completed = {step['id'] for step in steps if step['status'] == 'completed'}
+    pending = [step for step in steps if step['status'] == 'pending']
+    ready = [step for step in pending if all(dep in completed for dep in step.get('depends_on', []))]
+    if pending and not ready:
+        logger.warning(f"步骤依赖无法满足，按顺序执行: {pending[0]['id']}")
+        ready = pending[:1]
+    return ready
+
+
+def _dispatch_steps(plan: dict, user_message: str, observations: list, task_folder: str):
+    """把所有可执行步骤作为并行分支分发给execute节点，没有待执行步骤时进入report"""
+    ready = _ready_steps(plan)
+    if not ready:
+        logger.info("所有步骤已完成，跳转到report节点")
+        return 'report'
+    logger.info(f"并行分发 {len(ready)} 个步骤: {[step['id'] for step in ready]}")
+    return [Send('execute', {"step": step, "user_message": user_message,
+                             "observations": observations, "task_folder": task_folder}) for step in ready]
+
+
+def _ensure_task_folder(state: State) -> str:
+    # Create task folder first if not already created
+    if state.get('task_folder'):
+        return state['task_folder']
+    task_folder_result = create_task_folder.invoke({"user_message": state['user_message']})
+    if "task_folder" in task_folder_result:
+        logger.info(f"Created task folder: {task_folder_result['task_folder']}")
+        return task_folder_result["task_folder"]
+    logger.error(f"Failed to create task folder: {task_folder_result}")
+    return ""
+
+
+def _planner_messages(state: State) -> list:
+    return [SystemMessage(content=PLAN_SYSTEM_PROMPT), HumanMessage(content=PLAN_CREATE_PROMPT.format(user_message = state['user_message']))]
+
+
+def _planner_command(state: State, response: dict, task_folder: str, trace: list) -> Command:
+    plan = _normalize_plan(json.loads(extract_json(extract_answer(response['content']))))
+    goto = _dispatch_steps(plan, state['user_message'], state.get('observations') or [], task_folder)
+    return Command(goto=goto, update={"plan": plan, "task_folder": task_folder, "trace": trace,
+                                      "messages": [AIMessage(content=json.dumps(plan, ensure_ascii=False))]})
+
+
 def create_planner_node(state: State):
     logger.info("***正在运行Create Planner node***")
-    
-    # Create task folder first if not already created
-    if not state.get('task_folder'):
-        task_folder_result = create_task_folder.invoke({"user_message": state['user_message']})
-        if "task_folder" in task_folder_result:
-            task_folder = task_folder_result["task_folder"]
-            logger.info(f"Created task folder: {task_folder}")
-        else:
-            task_folder = ""
-            logger.error(f"Failed to create task folder: {task_folder_result}")
-    else:
-        task_folder = state['task_folder']
-    
-    messages = [SystemMessage(content=PLAN_SYSTEM_PROMPT), HumanMessage(content=PLAN_CREATE_PROMPT.format(user_message = state['user_message']))]
-    response = llm.invoke(messages)
-    response = response.model_dump_json(indent=4, exclude_none=True)
-    response = json.loads(response)
-    plan = json.loads(extract_json(extract_answer(response['content'])))
-    state['messages'] += [AIMessage(content=json.dumps(plan, ensure_ascii=False))]
-    return Command(goto="execute", update={"plan": plan, "task_folder": task_folder})
-
-def execute_node(state: State):
-    logger.info("***正在运行execute_node***")
-  
-    plan = state['plan']
-    steps = plan['steps']
-    current_step = None
-    current_step_index = 0
-    
-    # 获取第一个未完成STEP
-    for i, step in enumerate(steps):
-        status = step['status']
-        if status == 'pending':
-            current_step = step
-            current_step_index = i
-            break
-        
+    task_folder = _ensure_task_folder(state)
+    with node_span("create_planner", task_folder) as trace:
+        response = _call_llm(_planner_messages(state), task_folder=task_folder)
+    return _planner_command(state, response, task_folder, trace.spans)
+
+
+async def acreate_planner_node(state: State):
+    """create_planner_node的异步版本"""
+    logger.info("***正在运行Create Planner node(async)***")
+    task_folder = _ensure_task_folder(state)
+    with node_span("create_planner", task_folder) as trace:
+        response = await _acall_llm(_planner_messages(state), task_folder=task_folder)
+    return _planner_command(state, response, task_folder, trace.spans)
+
+
+def _execute_messages(state: StepState):
+    """返回本步骤的初始消息，以及在每次调用LLM前把消息压到token预算内的ContextBudget"""
+    current_step = state['step']
     logger.info(f"当前执行STEP:{current_step}")
-    
-    # 如果没有待执行的步骤，跳转到report节点
-    if current_step is None:
-        logger.info("所有步骤已完成，跳转到report节点")
-        return Command(goto='report')
-    
     # 过滤掉ToolMessage，只保留SystemMessage、HumanMessage和AIMessage
     filtered_observations = [msg for msg in state['observations'] if not isinstance(msg, ToolMessage)]
     messages = filtered_observations + [SystemMessage(content=EXECUTE_SYSTEM_PROMPT), HumanMessage(content=EXECUTION_PROMPT.format(user_message=state['user_message'], step=current_step['description']))]
-    
-    tool_result = None
-    while True:
-        # 绑定所有可用工具
-        available_tools = [
-            create_file, str_replace, shell_exec, read_csv_data, data_statistics_analysis,
-            create_visualization, trend_analysis, category_analysis, correlation_analysis,
-            outlier_detection, data_export, read_file_content, list_files
-        ]
-        response = llm.bind_tools(available_tools).invoke(messages)
-        response = response.model_dump_json(indent=4, exclude_none=True)
-        response = json.loads(response)
-        
-        tools = {
-            "create_file": create_file, "str_replace": str_replace, "shell_exec": shell_exec,
-            "read_csv_data": read_csv_data, "data_statistics_analysis": data_statistics_analysis,
-            "create_visualization": create_visualization, "trend_analysis": trend_analysis,
-            "category_analysis": category_analysis, "correlation_analysis": correlation_analysis,
-            "outlier_detection": outlier_detection, "data_export": data_export,
-            "read_file_content": read_file_content, "list_files": list_files
-        }     
-        if response['tool_calls']:
-            # 先添加AI响应消息
-            messages += [AIMessage(content=response['content'], tool_calls=response['tool_calls'])]
-            for tool_call in response['tool_calls']:
-                tool_name = tool_call['name']
-                tool_args = tool_call['args']
-                
-                # 为所有需要task_folder的工具自动添加task_folder参数
-                tools_need_task_folder = [
-                    'create_file', 'data_statistics_analysis', 'create_visualization', 
-                    'trend_analysis', 'category_analysis', 'correlation_analysis', 
-                    'outlier_detection', 'data_export', 'read_file_content', 'list_files'
-                ]
-                
-                if tool_name in tools_need_task_folder and state.get('task_folder'):
-                    tool_args['task_folder'] = state['task_folder']
-                
-                tool_result = tools[tool_name].invoke(tool_args)
-                logger.info(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
-                messages += [ToolMessage(content=f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}", tool_call_id=tool_call['id'])]
-        
-        elif '<tool_call>' in response['content']:
-            # 某些模型使用不同的tool call格式
-            logger.info("检测到<tool_call>标签，但LiteLLM应该使用标准tool_calls格式")
-            break
-        else:    
-            break
-        
+    return messages, ContextBudget(state.get('task_folder'), len(filtered_observations))
+
+
+def _execute_continues(messages: list, response: dict) -> bool:
+    """工具调用需要继续循环时返回True，并先把AI响应消息加入上下文"""
+    if response['tool_calls']:
+        messages += [AIMessage(content=response['content'], tool_calls=response['tool_calls'])]
+        return True
+    if '<tool_call>' in response['content']:
+        # 某些模型使用不同的tool call格式
+        logger.info("检测到<tool_call>标签，但LiteLLM应该使用标准tool_calls格式")
+    return False
+
+
+def _execute_result(state: StepState, response: dict, budget: ContextBudget, trace) -> dict:
     logger.info(f"当前STEP执行总结:{extract_answer(response['content'])}")
-    
-    # 标记当前步骤为已完成
-    current_step['status'] = 'completed'
-    
-    state['messages'] += [AIMessage(content=extract_answer(response['content']))]
-    # 只添加执行总结到observations，不添加ToolMessage（避免格式问题）
-    state['observations'] += [AIMessage(content=extract_answer(response['content']))]
-    
-    # 检查是否还有未完成的步骤
-    remaining_pending_steps = [step for step in steps if step['status'] == 'pending']
-    
-    if remaining_pending_steps:
-        logger.info(f"还有 {len(remaining_pending_steps)} 个步骤待执行，继续执行")
-        return Command(goto='execute', update={'plan': plan})
-    else:
-        logger.info("所有步骤已完成，跳转到report节点")
-        return Command(goto='report', update={'plan': plan})
-    
+    if budget.tokens_saved:
+        logger.info(f"✂️ STEP {state['step'].get('id')} 上下文压缩节省约 {budget.tokens_saved} tokens")
+    # 只添加执行总结到observations，不添加ToolMessage（避免格式问题）；步骤完成状态由join节点统一回写plan
+    summary = AIMessage(content=extract_answer(response['content']))
+    return {"messages": [summary], "observations": [summary], "completed_steps": [state['step']['id']], "trace": trace.spans}
 
-    
-def report_node(state: State):
-    """Report node that write a final report."""
-    logger.info("***正在运行report_node***")
-    
+
+def execute_node(state: StepState):
+    """执行单个计划步骤，多个互不依赖的步骤会作为并行分支同时运行"""
+    logger.info("***正在运行execute_node***")
+    messages, budget = _execute_messages(state)
+    with node_span("execute", state.get('task_folder'), step_id=state['step'].get('id')) as trace:
+        while True:
+            messages = budget.fit(messages)
+            response = _call_llm(messages, EXECUTE_TOOLS, state.get('task_folder'))
+            if not _execute_continues(messages, response):
+                break
+            messages += _run_tool_calls(response['tool_calls'], EXECUTE_TOOLS, EXECUTE_TOOLS_NEED_TASK_FOLDER, state.get('task_folder'))
+        trace.attributes["context_tokens_saved"] = budget.tokens_saved
+    return _execute_result(state, response, budget, trace)
+
+
+async def aexecute_node(state: StepState):
+    """execute_node的异步版本"""
+    logger.info("***正在运行execute_node(async)***")
+    messages, budget = _execute_messages(state)
+    with node_span("execute", state.get('task_folder'), step_id=state['step'].get('id')) as trace:
+        while True:
+            messages = budget.fit(messages)
+            response = await _acall_llm(messages, EXECUTE_TOOLS, state.get('task_folder'))
+            if not _execute_continues(messages, response):
+                break
+            messages += await _arun_tool_calls(response['tool_calls'], EXECUTE_TOOLS, EXECUTE_TOOLS_NEED_TASK_FOLDER, state.get('task_folder'))
+        trace.attributes["context_tokens_saved"] = budget.tokens_saved
+    return _execute_result(state, response, budget, trace)
+
+
+def join_node(state: State):
+    """汇合同一批并行分支：回写步骤状态，再分发新解锁的步骤或进入report"""
+    logger.info("***正在运行join_node***")
+
+    with node_span("join", state.get('task_folder')) as trace:
+        plan = state['plan']
+        completed = set(state.get('completed_steps') or [])
+        for step in plan['steps']:
+            if step['id'] in completed:
+                # 标记当前步骤为已完成
+                step['status'] = 'completed'
+
+        remaining_pending_steps = [step for step in plan['steps'] if step['status'] == 'pending']
+        logger.info(f"还有 {len(remaining_pending_steps)} 个步骤待执行")
+        goto = _dispatch_steps(plan, state['user_message'], state.get('observations') or [], state.get('task_folder'))
+    return Command(goto=goto, update={'plan': plan, 'trace': trace.spans})
+
+
+def _report_messages(state: State) -> list:
     observations = state.get("observations")
     # 过滤掉ToolMessage，只保留SystemMessage、HumanMessage和AIMessage
     filtered_observations = [msg for msg in observations if not isinstance(msg, ToolMessage)] if observations else []
-    messages = filtered_observations + [SystemMessage(content=REPORT_SYSTEM_PROMPT)]
-    
-    while True:
-        # 绑定报告生成所需工具
-        report_tools = [
-            create_file, shell_exec, data_export, read_file_content, list_files
-        ]
-        response = llm.bind_tools(report_tools).invoke(messages)
-        response = response.model_dump_json(indent=4, exclude_none=True)
-        response = json.loads(response)
-        
-        tools = {
-            "create_file": create_file, "shell_exec": shell_exec,
-            "data_export": data_export, "read_file_content": read_file_content,
-            "list_files": list_files
-        } 
-        if response['tool_calls']:    
-            for tool_call in response['tool_calls']:
-                tool_name = tool_call['name']
-                tool_args = tool_call['args']
-                
-                # 为所有需要task_folder的工具自动添加task_folder参数
-                tools_need_task_folder = [
-                    'create_file', 'data_export', 'read_file_content', 'list_files'
-                ]
-                
-                if tool_name in tools_need_task_folder and state.get('task_folder'):
-                    tool_args['task_folder'] = state['task_folder']
-                
-                tool_result = tools[tool_name].invoke(tool_args)
-                logger.info(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
-                messages += [ToolMessage(content=f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}", tool_call_id=tool_call['id'])]
-        else:
-            break
-            
+    return filtered_observations + [SystemMessage(content=REPORT_SYSTEM_PROMPT)]
+
+
+def _report_result(state: State, response: dict, trace: list) -> dict:
     logger.info("报告生成完成")
-    return {"final_report": response['content']}
\ No newline at end of file
+    # 报告是最后一个节点，此时导出整个任务的追踪数据
+    spans = (state.get('trace') or []) + trace
+    logger.info(f"⏱️ 耗时汇总: {json.dumps(summarize(spans), ensure_ascii=False)}")
+    export_trace(spans, state.get('task_folder'))
+    return {"final_report": response['content'], "trace": trace}
+
+
+def report_node(state: State):
+    """Report node that write a final report."""
+    logger.info("***正在运行report_node***")
+    messages = _report_messages(state)
+    with node_span("report", state.get('task_folder')) as trace:
+        while True:
+            response = _call_llm(messages, REPORT_TOOLS, state.get('task_folder'))
+            if not response['tool_calls']:
+                break
+            messages += _run_tool_calls(response['tool_calls'], REPORT_TOOLS, REPORT_TOOLS_NEED_TASK_FOLDER, state.get('task_folder'))
+    return _report_result(state, response, trace.spans)
+
+
+async def areport_node(state: State):
+    """report_node的异步版本"""
+    logger.info("***正在运行report_node(async)***")
+    messages = _report_messages(state)
+    with node_span("report", state.get('task_folder')) as trace:
+        while True:
+            response = await _acall_llm(messages, REPORT_TOOLS, state.get('task_folder'))
+            if not response['tool_calls']:
+                break
+            messages += await _arun_tool_calls(response['tool_calls'], REPORT_TOOLS, REPORT_TOOLS_NEED_TASK_FOLDER, state.get('task_folder'))
+    return _report_result(state, response, trace.spans)
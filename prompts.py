@@ -49,10 +49,12 @@ Return format requirements:
 - Return in JSON format, must comply with JSON standards, cannot include any content not in JSON standard
 - JSON fields are as follows:
     - thought: string, required, response to user's message and thinking about the task, as detailed as possible
-    - steps: array, each step contains title and description
+    - steps: array, each step contains id, title, description, status and depends_on
+        - id: string, required, unique step id such as "1", "2", ...
         - title: string, required, step title
         - description: string, required, detailed step description
         - status: string, required, step status, can be "pending" or "completed"
+        - depends_on: array of step ids, required, the steps whose results this step needs; use an empty array for steps that only need the raw data. Independent analytical branches must NOT depend on each other so that they can run in parallel
     - goal: string, plan goal generated based on the context
 - If the task is determined to be unfeasible, return an empty array for steps and empty string for goal
 
@@ -62,64 +64,88 @@ EXAMPLE JSON OUTPUT:
    "goal": "Complete multi-dimensional data analysis with branched analysis and comprehensive summaries",
    "steps": [
       {{  
+            "id": "1",
             "title": "Data Loading and Quality Assessment",
             "description": "Load dataset, perform comprehensive data quality assessment, examine structure, data types, missing values, duplicates, and anomalies. Generate data profile summary and quality report.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": []
       }},
       {{
+            "id": "2",
             "title": "Overall Statistical Overview and Baseline Analysis", 
             "description": "Perform comprehensive baseline statistical analysis including descriptive statistics, distributions, correlations, and overall data characteristics. Establish analytical foundation and key metrics.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "3",
             "title": "Time-Series Analysis Branch",
             "description": "Conduct detailed time-based analysis including trend analysis, seasonality detection, growth rates, year-over-year comparisons, and temporal patterns. Generate time-series visualizations and trend summaries.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "4",
             "title": "Categorical Analysis Branch",
             "description": "Perform deep categorical analysis including category performance comparison, market share analysis, top/bottom performers identification, and categorical distributions. Generate comparative charts and rankings.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "5",
             "title": "Regional/Geographical Analysis Branch",
             "description": "Analyze geographical patterns, regional performance differences, spatial clustering, and location-based insights. Create regional comparison charts and geographical performance maps.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "6",
             "title": "Performance Metrics and KPI Analysis Branch",
             "description": "Calculate and analyze key performance indicators, efficiency metrics, productivity measures, and performance benchmarks. Generate KPI dashboards and performance scorecards.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "7",
             "title": "Correlation and Relationship Analysis Branch",
             "description": "Identify relationships between variables, correlation analysis, dependency detection, and causal relationships. Generate correlation matrices and relationship visualizations.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "8",
             "title": "Outlier and Anomaly Analysis Branch",
             "description": "Detect outliers, anomalies, and unusual patterns. Analyze exceptional cases, investigate root causes, and assess impact on overall trends.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "9",
             "title": "Segmentation and Clustering Analysis Branch",
             "description": "Perform data segmentation, cluster analysis, group identification, and segment characterization. Generate segment profiles and clustering visualizations.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "10",
             "title": "Predictive and Forecast Analysis Branch",
             "description": "Generate forecasts, trend predictions, scenario analysis, and future projections based on historical patterns. Create predictive models and forecast visualizations.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["1"]
       }},
       {{
+            "id": "11",
             "title": "Business Intelligence and Strategic Insights",
             "description": "Synthesize findings from all analytical branches, generate strategic insights, business recommendations, and actionable intelligence. Create executive summary with key takeaways.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["2", "3", "4", "5", "6", "7", "8", "9", "10"]
       }},
       {{
+            "id": "12",
             "title": "Comprehensive Multi-Branch Report Generation",
             "description": "Create detailed analytical report integrating all analytical branches, with executive summary, methodology, findings from each branch, cross-branch insights, conclusions, and strategic recommendations.",
-            "status": "pending"
+            "status": "pending",
+            "depends_on": ["11"]
       }}
    ]
 }}
@@ -130,6 +156,7 @@ Create a plan according to the following requirements:
 - Include at least 8-12 detailed analytical steps with branched analysis
 - Plan for comprehensive summaries for each analytical branch
 - Ensure cross-branch analysis and integration of findings
+- Declare dependencies with depends_on: branches that only need the loaded data depend on the data loading step, while synthesis and report steps depend on every branch they integrate
 - Plan for multiple types of charts and visualizations for each branch (15-20 total visualizations)
 - Include advanced analytical techniques (clustering, correlation, forecasting)
 - Plan for generating intermediate analysis files and summaries for each branch
@@ -289,6 +316,8 @@ Select appropriate tools to complete the <current_step> with deep, comprehensive
    - category_analysis() for categorical steps  
    - correlation_analysis() for relationship steps
    - outlier_detection() for anomaly steps
+   - sql_query() for any other aggregation, filter, ranking or cross-tab (read-only SQL over the CSV, table name `data`),
+     instead of writing a Python script and running it with shell_exec
 
 5. **SAVE COMPREHENSIVE SUMMARY**: 
    - create_file(file_name="[branch_name]_summary.md", file_contents="[500+ words detailed analysis]")
@@ -0,0 +1,135 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : replay.py
+# Time       ：2025/7/15 14:05
+# Author     ：aigonna
+"""
+LLM对话录制与回放，用于离线基准测试和性能分析
+
+    - 录制：设置LLM_RECORD=路径，每次LLM响应（包括tool_calls）追加写入JSONL文件
+    - 回放：设置LLM_REPLAY=路径，get_llm()返回ReplayChatModel，按请求内容确定性地返回录制的响应，
+      工具仍然真实执行，整张图可以在没有模型服务的机器上完整运行
+
+请求键复用llm_cache.request_key（不含模型名和温度），任务文件夹路径替换为占位符，
+因此回放时新建的任务文件夹不影响匹配。键未命中时（例如工具输出有变化）按录制顺序取下一条未使用的响应。
+"""
+import os
+import json
+import threading
+import contextvars
+import contextlib
+from collections import deque
+from typing import Any, List, Optional
+from loguru import logger
+from pydantic import PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from llm_cache import request_key, tool_schemas, mask_task_folder, unmask_task_folder
+
+# 当前LLM调用所属的任务文件夹，由nodes在调用模型前设置，回放模型据此规范化请求
+_current_task_folder = contextvars.ContextVar("current_task_folder", default="")
+
+
+@contextlib.contextmanager
+def task_folder_scope(task_folder: str):
+    token = _current_task_folder.set(task_folder or "")
+    try:
+        yield
+    finally:
+        _current_task_folder.reset(token)
+
+
+class TranscriptRecorder:
+    """线程安全地把LLM响应逐条追加到JSONL录制文件"""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._seq = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def record(self, messages: list, tools: list, task_folder: str, response: dict):
+        key = request_key(messages, tools, task_folder)
+        raw = mask_task_folder(json.dumps(response, ensure_ascii=False, default=str), task_folder, in_json=True)
+        with self._lock:
+            entry = {"seq": self._seq, "key": key, "response": json.loads(raw)}
+            self._seq += 1
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def load_transcript(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry["seq"])
+
+
+class ReplayChatModel(BaseChatModel):
+    """按录制文件返回响应的本地模型，不访问任何模型服务"""
+
+    transcript_path: str
+    model: str = "replay"
+    temperature: Optional[float] = None
+
+    _by_key: dict = PrivateAttr(default_factory=dict)
+    _unused: list = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        entries = load_transcript(self.transcript_path)
+        for entry in entries:
+            self._by_key.setdefault(entry["key"], deque()).append(entry)
+        self._unused = entries
+        logger.info(f"📼 回放模式: 从 {self.transcript_path} 载入 {len(entries)} 条LLM响应")
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools: list, **kwargs):
+        # 绑定的工具只参与请求键的计算，与录制时ChatLiteLLM.bind_tools的工具列表一致即可
+        return self.bind(tools=tool_schemas(tools), **kwargs)
+
+    def _take(self, key: str) -> dict:
+        with self._lock:
+            queue = self._by_key.get(key)
+            if queue:
+                entry = queue.popleft() if len(queue) > 1 else queue[0]
+            else:
+                if not self._unused:
+                    raise ValueError(f"回放文件 {self.transcript_path} 中的响应已用完")
+                entry = self._unused[0]
+                logger.warning(f"⚠️ 回放请求未匹配录制内容，按顺序使用第 {entry['seq']} 条响应")
+            # 同一条响应只在顺序回退中使用一次
+            self._unused = [item for item in self._unused if item is not entry]
+            return entry["response"]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, tools: list = None, **kwargs) -> ChatResult:
+        task_folder = _current_task_folder.get()
+        response = self._take(request_key(messages, tools, task_folder))
+        response = json.loads(unmask_task_folder(json.dumps(response, ensure_ascii=False), task_folder, in_json=True))
+        message = AIMessage(content=response.get("content", ""),
+                            tool_calls=response.get("tool_calls") or [],
+                            additional_kwargs=response.get("additional_kwargs") or {},
+                            response_metadata=response.get("response_metadata") or {},
+                            usage_metadata=response.get("usage_metadata"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """LLM_RECORD设置时返回进程内共享的TranscriptRecorder，否则返回None"""
+    global _recorder
+    path = os.getenv("LLM_RECORD")
+    if not path:
+        return None
+    with _recorder_lock:
+        if _recorder is None or _recorder.path != os.path.abspath(path):
+            _recorder = TranscriptRecorder(path)
+            logger.info(f"📼 录制模式: LLM响应写入 {_recorder.path}")
+        return _recorder
@@ -0,0 +1,90 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : shaping.py
+# Time       ：2025/7/17 16:02
+# Author     ：aigonna
+"""
+工具结果整形：把返回给LLM的工具结果限制在TOOL_RESULT_MAX_BYTES以内
+
+outlier_detection的outlier_values、trend_analysis的monthly_summary、correlation_matrix等结果
+在大数据集上可能有几百KB。超出上限时，完整结果写入task_folder/results下的JSON文件，
+返回给LLM的是结构相同的紧凑摘要：列表只保留前k项和总数（数值列表附带最小值/最大值），
+字典只保留前k个键，长字符串截断，并附上完整结果的文件路径。
+"""
+import os
+import json
+import hashlib
+
+# 返回给LLM的单个工具结果字节上限（序列化后），0表示不整形
+TOOL_RESULT_MAX_BYTES = int(os.getenv("TOOL_RESULT_MAX_BYTES", "8000"))
+# 列表/字典摘要保留的条目数上限
+TOOL_RESULT_TOP_K = int(os.getenv("TOOL_RESULT_TOP_K", "10"))
+RESULTS_DIR = "results"
+_MAX_STRING_CHARS = 500
+
+
+def _size(obj) -> int:
+    return len(json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _compact(obj, top_k: int, max_chars: int):
+    """递归生成紧凑摘要，保持原有的键结构"""
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        compact = {key: _compact(value, top_k, max_chars) for key, value in items[:top_k]}
+        if len(items) > top_k:
+            compact["_omitted_keys"] = len(items) - top_k
+        return compact
+    if isinstance(obj, (list, tuple)):
+        if len(obj) <= top_k:
+            return [_compact(item, top_k, max_chars) for item in obj]
+        summary = {"count": len(obj), "head": [_compact(item, top_k, max_chars) for item in obj[:top_k]]}
+        numbers = [item for item in obj if isinstance(item, (int, float)) and not isinstance(item, bool)]
+        if len(numbers) == len(obj):
+            summary["min"] = min(numbers)
+            summary["max"] = max(numbers)
+        return summary
+    if isinstance(obj, str) and len(obj) > max_chars:
+        return obj[:max_chars] + f"...(共{len(obj)}字符)"
+    return obj
+
+
+def _save_full_result(tool_name: str, result, task_folder: str) -> str:
+    raw = json.dumps(result, ensure_ascii=False, indent=2, default=str)
+    digest = hashlib.md5(raw.replace(task_folder, "").encode("utf-8") if task_folder else raw.encode("utf-8")).hexdigest()[:12]
+    folder = os.path.join(task_folder or "output", RESULTS_DIR)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{tool_name}_{digest}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(raw)
+    return path
+
+
+def shape_result(tool_name: str, result, task_folder: str = "", max_bytes: int = None):
+    """
+    工具结果超过字节上限时，完整结果落盘并返回紧凑摘要
+    :param tool_name: 工具名称，用于结果文件命名
+    :param result: 工具原始结果
+    :param task_folder: 任务文件夹
+    :param max_bytes: 字节上限，默认TOOL_RESULT_MAX_BYTES
+    :return: 原结果（未超出上限时）或包含full_result_path的摘要字典
+    """
+    max_bytes = TOOL_RESULT_MAX_BYTES if max_bytes is None else max_bytes
+    if not max_bytes or not isinstance(result, (dict, list)):
+        return result
+    original_bytes = _size(result)
+    if original_bytes <= max_bytes:
+        return result
+
+    path = _save_full_result(tool_name, result, task_folder)
+    note = {"truncated": True, "original_bytes": original_bytes, "full_result_path": path,
+            "note": "结果过大，仅返回摘要，完整结果见full_result_path，可用read_file_content读取"}
+    # 逐步缩小保留的条目数和字符串长度，直到摘要满足上限
+    top_k, max_chars = TOOL_RESULT_TOP_K, _MAX_STRING_CHARS
+    while True:
+        compact = _compact(result, top_k, max_chars)
+        shaped = dict(compact, **note) if isinstance(compact, dict) else dict(note, summary=compact)
+        if _size(shaped) <= max_bytes or (top_k == 1 and max_chars <= 50):
+            return shaped
+        top_k = max(1, top_k // 2)
+        max_chars = max(50, max_chars // 2)
@@ -0,0 +1,279 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : sketches.py
+# Time       ：2025/7/22 10:05
+# Author     ：aigonna
+"""
+可合并的流式统计摘要，供分块引擎和近似模式使用
+
+    - Moments：计数、均值、二阶中心矩（Chan合并公式），得到精确的均值/标准差，以及最小值/最大值
+    - QuantileSketch：KLL分位数草图，内存为O(k·log(n/k))，秩误差约为rank_error()
+    - HyperLogLog：基数估计，2^p个寄存器，相对标准误差约1.04/sqrt(2^p)
+    - DuplicateEstimator：基于行哈希的重复行计数，哈希数超过上限后按哈希值抽样（相同的行同进同出），给出95%误差界
+    - hash_column/hash_values/hash_rows：与分块无关的64位哈希，同一个值在不同分块中得到相同的哈希
+
+所有摘要都支持merge，按块计算后合并的结果与一次性计算的结果一致（草图在误差范围内一致）。
+"""
+import os
+import numpy as np
+import pandas as pd
+
+# KLL草图最高层的容量，越大越精确
+QUANTILE_SKETCH_K = int(os.getenv("QUANTILE_SKETCH_K", "200"))
+# HyperLogLog寄存器数为2^HLL_PRECISION
+HLL_PRECISION = int(os.getenv("HLL_PRECISION", "14"))
+# 重复行统计最多保存的行哈希数（每个8字节），超出后按哈希值抽样
+DUPLICATE_HASH_LIMIT = int(os.getenv("DUPLICATE_HASH_LIMIT", "5000000"))
+
+
+class Moments:
+    """多列的计数、均值、二阶中心矩、最小值和最大值，按列向量化合并"""
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.nan)
+        self.max = np.full(size, np.nan)
+
+    def update(self, frame: pd.DataFrame):
+        """frame的列与columns一致，值为浮点数，空值为NaN"""
+        values = frame[self.columns].to_numpy(dtype=float)
+        count = np.sum(~np.isnan(values), axis=0).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, np.nansum(values, axis=0) / np.maximum(count, 1), 0.0)
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+        self._combine(count, mean, m2, np.nanmin(values, axis=0, initial=np.inf), np.nanmax(values, axis=0, initial=-np.inf))
+
+    def merge(self, other: "Moments"):
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        total = self.count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / np.maximum(total, 1), 0.0)
+            self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / np.maximum(total, 1)
+        self.count = total
+        minimum = np.where(np.isinf(minimum), np.nan, minimum)
+        maximum = np.where(np.isinf(maximum), np.nan, maximum)
+        self.min = np.fmin(self.min, minimum)
+        self.max = np.fmax(self.max, maximum)
+
+    def std(self) -> np.ndarray:
+        """样本标准差（ddof=1），与pandas一致"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def final_mean(self) -> np.ndarray:
+        return np.where(self.count > 0, self.mean, np.nan)
+
+
+class QuantileSketch:
+    """
+    KLL分位数草图：第h层的每个元素代表2^h个原始值，层满时排序后随机保留奇数或偶数位置的一半提升到上一层
+    随机数种子固定，相同输入得到相同结果
+    """
+
+    def __init__(self, k: int = None, seed: int = 0):
+        self.k = k or QUANTILE_SKETCH_K
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.nan
+        self.max = np.nan
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "QuantileSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # 奇数个元素时留下一个，其余两两配对后保留一半
+                keep, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+                promoted = items[int(self._rng.integers(2))::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q: float) -> float:
+        """估计q分位数，q=0和q=1返回精确的最小值和最大值"""
+        if not self.n:
+            return np.nan
+        if q <= 0:
+            return float(self.min)
+        if q >= 1:
+            return float(self.max)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        index = min(int(np.searchsorted(cumulative, q * cumulative[-1])), len(order) - 1)
+        return float(items[order][index])
+
+    def rank_error(self) -> float:
+        """归一化秩误差（单个分位数，约99%置信度），样本全部保留时为0"""
+        if len(self.levels) == 1:
+            return 0.0
+        return round(2.446 / self.k ** 0.9433, 4)
+
+
+def _leading_zeros32(values: np.ndarray) -> np.ndarray:
+    """32位无符号整数的前导零个数，输入为0时返回32"""
+    _, exponent = np.frexp(values.astype(np.float64))
+    return np.where(values == 0, 32, 32 - exponent)
+
+
+class HyperLogLog:
+    """HyperLogLog基数估计，输入为64位哈希"""
+
+    def __init__(self, precision: int = None):
+        self.p = precision or HLL_PRECISION
+        self.registers = np.zeros(1 << self.p, dtype=np.uint8)
+
+    def update(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(hashes):
+            return
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes << np.uint64(self.p)
+        high = (rest >> np.uint64(32)).astype(np.uint32)
+        low = (rest & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        zeros = np.where(high == 0, 32 + _leading_zeros32(low), _leading_zeros32(high))
+        rank = np.minimum(zeros, 64 - self.p) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(float)))
+        zeros = int(np.sum(self.registers == 0))
+        # 小基数时使用线性计数
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+    def relative_error(self) -> float:
+        """相对标准误差"""
+        return round(1.04 / np.sqrt(len(self.registers)), 4)
+
+
+def _normalize(column: pd.Series) -> pd.Series:
+    """数值统一为float64、其他统一为字符串，保证同一个值在不同分块/类型推断下哈希一致"""
+    if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+        return column.astype('float64')
+    if pd.api.types.is_datetime64_any_dtype(column.dtype) or pd.api.types.is_string_dtype(column.dtype):
+        return column
+    return column.astype('str')
+
+
+def hash_column(column: pd.Series) -> np.ndarray:
+    """逐行的64位哈希（空值也有固定哈希）；category列只对类别取值计算哈希再按编码展开"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = hash_column(pd.Series(column.cat.categories))
+        missing = hash_column(pd.Series([None], dtype='str'))[0]
+        codes = column.cat.codes.to_numpy()
+        return np.where(codes >= 0, categories[codes], missing)
+    return pd.util.hash_pandas_object(_normalize(column), index=False).to_numpy()
+
+
+def hash_values(column: pd.Series) -> np.ndarray:
+    """单列非空值的64位哈希"""
+    return hash_column(column.dropna())
+
+
+def combine_hashes(hashes: list) -> np.ndarray:
+    """把多列的逐行哈希合并为整行哈希"""
+    combined = np.full(len(hashes[0]), 0x345678, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for i, column_hashes in enumerate(hashes):
+            combined = (combined ^ column_hashes) * np.uint64(1000003 + 2 * i)
+    return combined
+
+
+def hash_rows(frame: pd.DataFrame) -> np.ndarray:
+    """整行的64位哈希，用于重复行统计"""
+    return combine_hashes([hash_column(column) for _, column in frame.items()])
+
+
+class DuplicateEstimator:
+    """
+    重复行计数：保存整行哈希，排序后统计哈希相同的行；保存的哈希超过limit时只保留哈希值最高位为0的部分，
+    抽样率每次减半。相同的行哈希相同，抽样时整组保留或整组丢弃，估计无偏
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit or DUPLICATE_HASH_LIMIT
+        self.bits = 0  # 抽样率为2^-bits
+        self.rows = 0
+        self.kept = []
+        self.kept_count = 0
+
+    def _sample(self, hashes: np.ndarray) -> np.ndarray:
+        return hashes[(hashes >> np.uint64(64 - self.bits)) == 0] if self.bits else hashes
+
+    def update(self, hashes: np.ndarray):
+        self.rows += len(hashes)
+        hashes = self._sample(np.asarray(hashes, dtype=np.uint64))
+        self.kept.append(hashes)
+        self.kept_count += len(hashes)
+        while self.kept_count > self.limit and self.bits < 63:
+            self.bits += 1
+            kept = self._sample(np.concatenate(self.kept))
+            self.kept, self.kept_count = [kept], len(kept)
+
+    @property
+    def exact(self) -> bool:
+        return self.bits == 0
+
+    def result(self) -> dict:
+        """
+        :return: duplicate_rows（估计值）、error_bound（95%误差界，精确时为0）、sample_rate，
+                 以及expected_hash_collisions（64位哈希碰撞导致多计的期望行数）
+        """
+        hashes = np.concatenate(self.kept) if self.kept else np.empty(0, dtype=np.uint64)
+        hashes.sort()
+        self.kept = [hashes]
+        if len(hashes):
+            starts = np.flatnonzero(np.concatenate([[True], hashes[1:] != hashes[:-1]]))
+            extra = np.diff(np.append(starts, len(hashes))) - 1
+        else:
+            extra = np.empty(0)
+        rate = 2.0 ** -self.bits
+        variance = (1 - rate) / rate ** 2 * float(np.sum(extra.astype(float) ** 2))
+        return {"duplicate_rows": int(round(float(extra.sum()) / rate)),
+                "error_bound": int(np.ceil(1.96 * np.sqrt(variance))),
+                "sample_rate": rate,
+                "expected_hash_collisions": round(self.rows * (self.rows - 1) / 2 ** 65, 6)}
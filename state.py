@@ -3,15 +3,19 @@
 # File       : state.py
 # Time       ：2025/6/30 18:00
 # Author     ：aigonna
+import operator
 from langgraph.graph import MessagesState
-from typing import Optional, List, Dict, Literal
+from typing import Optional, List, Dict, Literal, Annotated
+from typing_extensions import TypedDict
 from enum import Enum
 from pydantic import BaseModel, Field
 
 class Step(BaseModel):
+    id: str = ""
     title: str = ""
     description: str = ""
     status: Literal["pending", "completed"] = "pending"
+    depends_on: List[str] = []  # 依赖的步骤id，依赖全部完成后才会执行
 
 class Plan(BaseModel):
     goal: str = ""
@@ -21,7 +25,15 @@ class Plan(BaseModel):
 class State(MessagesState):
     user_message: str = ""
     plan: Plan
-    observations: List = []
+    observations: Annotated[List, operator.add] = []  # 并行分支各自追加执行总结
+    completed_steps: Annotated[List[str], operator.add] = []  # 并行分支各自上报已完成的步骤id
     final_report: str = ""
     task_folder: str = ""  # 存储当前任务的输出文件夹路径
+    trace: Annotated[List[dict], operator.add] = []  # 节点/LLM/工具的耗时span，见tracing.py
 
+class StepState(TypedDict):
+    """通过Send分发给单个execute分支的输入"""
+    step: dict
+    user_message: str
+    observations: List
+    task_folder: str
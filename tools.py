@@ -10,18 +10,12 @@ import subprocess
 import uuid
 import re
 import json
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 from typing import Dict, List, Optional, Union
 import warnings
 warnings.filterwarnings('ignore')
 
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
+# pandas/numpy只在需要它们的工具中导入，图表在charts模块的渲染进程中绘制，只用到文件类工具的进程无需承担科学计算栈的导入开销
 
 
 @tool
@@ -160,94 +154,119 @@ def shell_exec(command: str) -> dict:
 
 # ====== 新增数据分析工具 ======
 
+def _plain(obj):
+    """
+    递归把结果中的numpy标量转为Python内置类型：numpy标量不能直接JSON序列化（default=str会写成字符串），
+    在返回给LLM的文本中也会显示为np.float32(...)
+    """
+    import numpy as np
+
+    if isinstance(obj, dict):
+        return {(key.item() if isinstance(key, (np.number, np.bool_)) else key): _plain(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        return _plain(obj.tolist())
+    if isinstance(obj, (np.number, np.bool_)):
+        return obj.item()
+    return obj
+
+
 @tool
 def read_csv_data(file_path: str, encoding: str = 'utf-8') -> dict:
     """
     读取CSV文件并返回基本信息
     :param file_path: CSV文件路径
-    :param encoding: 文件编码，默认utf-8
+    :param encoding: 优先尝试的文件编码，默认utf-8，实际编码会根据文件内容自动探测
     :return: 数据基本信息
     """
     try:
-        # 尝试不同编码
-        encodings_to_try = [encoding, 'utf-8', 'gbk', 'gb2312', 'latin1']
-        df = None
-        used_encoding = None
-        
-        for enc in encodings_to_try:
-            try:
-                df = pd.read_csv(file_path, encoding=enc)
-                used_encoding = enc
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if df is None:
-            return {"error": "Failed to read CSV with any encoding"}
+        import numpy as np
+        from dataset import load_dataframe, dataset_encoding, categorical_columns
+
+        # 基于文件开头样本探测编码后只完整解析一次，结果记录在数据集缓存中供其他工具复用
+        df = load_dataframe(file_path, encoding=encoding)
+        used_encoding = dataset_encoding(file_path)
         
         # 基本信息
         info = {
             "encoding_used": used_encoding,
             "shape": df.shape,
             "columns": df.columns.tolist(),
-            "dtypes": df.dtypes.to_dict(),
+            "dtypes": df.dtypes.astype(str).to_dict(),
             "memory_usage": df.memory_usage(deep=True).sum(),
             "null_counts": df.isnull().sum().to_dict(),
             "sample_data": df.head().to_dict(),
             "numerical_columns": df.select_dtypes(include=[np.number]).columns.tolist(),
-            "categorical_columns": df.select_dtypes(include=['object']).columns.tolist()
+            "categorical_columns": categorical_columns(df),
+            "datetime_columns": df.select_dtypes(include=['datetime']).columns.tolist()
         }
         
-        return {"messages": f"Successfully read CSV file with {used_encoding} encoding", "data_info": info}
+        return {"messages": f"Successfully read CSV file with {used_encoding} encoding", "data_info": _plain(info)}
     except Exception as e:
         return {"error": f"Error reading CSV: {str(e)}"}
 
 
 @tool
-def data_statistics_analysis(file_path: str, task_folder: str = "") -> dict:
+def data_statistics_analysis(file_path: str, task_folder: str = "", approximate: bool = False) -> dict:
     """
     对数据进行全面的统计分析
     :param file_path: 数据文件路径
     :param task_folder: 任务文件夹路径
+    :param approximate: 是否使用近似模式（分位数抽样、nunique和重复行用草图估计，结果附误差界），适合大表的交互式分析
     :return: 统计分析结果
     """
     try:
-        # 读取数据
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
-        # 数值型列统计
-        numerical_stats = df.describe()
-        
-        # 分类型列统计
-        categorical_stats = {}
-        for col in df.select_dtypes(include=['object']).columns:
-            categorical_stats[col] = {
-                "unique_count": df[col].nunique(),
-                "top_values": df[col].value_counts().head(10).to_dict(),
-                "null_count": df[col].isnull().sum()
-            }
+        import approx
+        import artifacts
+        import chunked
+        from dataset import load_dataframe, categorical_columns
+
+        if chunked.use_chunked(file_path):
+            # 大文件分块流式统计，峰值内存与文件大小无关
+            stats_summary = chunked.data_statistics(file_path)
+        elif approx.use_approximate(approximate):
+            stats_summary = artifacts.memoize(file_path, "approx_statistics", approx.data_statistics,
+                                              sample_rows=approx.APPROX_SAMPLE_ROWS)
+        else:
+            # 读取数据
+            df = load_dataframe(file_path)
+        
+            # 数值型列统计（describe、value_counts、相关系数等派生结果按数据集版本记忆化，其他工具共用）
+            numerical_stats = artifacts.describe(file_path)
+            null_counts = artifacts.null_counts(file_path)
+        
+            # 分类型列统计
+            categorical_stats = {}
+            for col in categorical_columns(df):
+                value_counts = artifacts.value_counts(file_path, col)
+                categorical_stats[col] = {
+                    "unique_count": int((value_counts > 0).sum()),
+                    "top_values": value_counts.head(10).to_dict(),
+                    "null_count": null_counts[col]
+                }
         
-        # 相关性分析
-        numerical_df = df.select_dtypes(include=[np.number])
-        correlation_matrix = numerical_df.corr()
+            # 相关性分析
+            correlation_matrix = artifacts.correlation_matrix(file_path)
         
-        # 数据质量分析
-        quality_analysis = {
-            "total_rows": len(df),
-            "duplicate_rows": df.duplicated().sum(),
-            "missing_data_summary": df.isnull().sum().to_dict(),
-            "missing_percentage": (df.isnull().sum() / len(df) * 100).to_dict()
-        }
+            # 数据质量分析
+            quality_analysis = {
+                "total_rows": len(df),
+                "duplicate_rows": artifacts.duplicate_rows(file_path),
+                "missing_data_summary": null_counts.to_dict(),
+                "missing_percentage": (null_counts / len(df) * 100).to_dict()
+            }
         
-        # 保存统计结果
-        stats_summary = {
-            "numerical_statistics": numerical_stats.to_dict(),
-            "categorical_statistics": categorical_stats,
-            "correlation_matrix": correlation_matrix.to_dict(),
-            "data_quality": quality_analysis
-        }
+            # 保存统计结果
+            stats_summary = {
+                "numerical_statistics": numerical_stats.to_dict(),
+                "categorical_statistics": categorical_stats,
+                "correlation_matrix": correlation_matrix.to_dict(),
+                "data_quality": quality_analysis
+            }
         
         # 生成统计报告文件
+        stats_summary = _plain(stats_summary)
         if task_folder:
             stats_file_path = os.path.join(task_folder, "statistical_analysis_summary.json")
             full_stats_path = os.path.join(os.getcwd(), stats_file_path)
@@ -261,7 +280,8 @@ def data_statistics_analysis(file_path: str, task_folder: str = "") -> dict:
 
 @tool
 def create_visualization(file_path: str, chart_type: str, x_column: str, y_column: str = None, 
-                        title: str = "Chart", task_folder: str = "", save_name: str = "chart.png") -> dict:
+                        title: str = "Chart", task_folder: str = "", save_name: str = "chart.png",
+                        preset: str = None) -> dict:
     """
     创建数据可视化图表
     :param file_path: 数据文件路径
@@ -271,95 +291,39 @@ def create_visualization(file_path: str, chart_type: str, x_column: str, y_colum
     :param title: 图表标题
     :param task_folder: 任务文件夹路径
     :param save_name: 保存的文件名
+    :param preset: 输出档案 (preview: 低DPI的PNG, print: 300DPI的PNG, svg: 矢量图)，默认使用CHART_PRESET环境变量
     :return: 图表创建结果
     """
     try:
-        # 读取数据
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
-        # 设置图表大小和样式
-        plt.figure(figsize=(12, 8))
-        plt.style.use('default')
-        
-        if chart_type == "bar":
-            if y_column:
-                sns.barplot(data=df, x=x_column, y=y_column)
-            else:
-                df[x_column].value_counts().head(20).plot(kind='bar')
-            plt.xticks(rotation=45)
-            
-        elif chart_type == "line":
-            if y_column:
-                plt.plot(df[x_column], df[y_column], marker='o')
-                plt.xlabel(x_column)
-                plt.ylabel(y_column)
-            else:
-                df[x_column].plot(kind='line')
-            
-        elif chart_type == "scatter":
-            if y_column:
-                plt.scatter(df[x_column], df[y_column], alpha=0.6)
-                plt.xlabel(x_column)
-                plt.ylabel(y_column)
-            else:
-                return {"error": "Scatter plot requires both x and y columns"}
-                
-        elif chart_type == "hist":
-            plt.hist(df[x_column], bins=30, alpha=0.7, edgecolor='black')
-            plt.xlabel(x_column)
-            plt.ylabel("Frequency")
-            
-        elif chart_type == "box":
-            if y_column:
-                sns.boxplot(data=df, x=x_column, y=y_column)
-            else:
-                sns.boxplot(data=df, y=x_column)
-            plt.xticks(rotation=45)
-            
-        elif chart_type == "pie":
-            value_counts = df[x_column].value_counts().head(10)
-            plt.pie(value_counts.values, labels=value_counts.index, autopct='%1.1f%%')
-            
-        elif chart_type == "heatmap":
-            # 数值型列的相关性热力图
-            numerical_df = df.select_dtypes(include=[np.number])
-            correlation_matrix = numerical_df.corr()
-            sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', center=0)
-            
-        else:
+        from charts import CHART_TYPES, resolve_preset, render
+
+        if chart_type not in CHART_TYPES:
             return {"error": f"Unsupported chart type: {chart_type}"}
-        
-        plt.title(title, fontsize=16, fontweight='bold')
-        plt.tight_layout()
-        
-        # 保存图表
-        if task_folder:
-            # 智能优化图表文件名
-            if not save_name.endswith('.png'):
-                save_name = f"{save_name}.png"
-            
-            # 添加图表类型前缀，让文件名更有意义
-            if not save_name.startswith(('chart_', 'plot_', 'graph_')):
-                save_name = f"chart_{chart_type}_{save_name}"
-            
-            chart_path = os.path.join(task_folder, save_name)
-            full_chart_path = os.path.join(os.getcwd(), chart_path)
-        else:
-            if not save_name.endswith('.png'):
-                save_name = f"{save_name}.png"
-            
-            if not save_name.startswith(('chart_', 'plot_', 'graph_')):
-                save_name = f"chart_{chart_type}_{save_name}"
-                
-            chart_path = os.path.join("output", save_name)
-            full_chart_path = os.path.join(os.getcwd(), chart_path)
-        
-        # 确保目录存在
-        os.makedirs(os.path.dirname(full_chart_path), exist_ok=True)
-        plt.savefig(full_chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return {"messages": f"Chart saved successfully at {full_chart_path}", "chart_path": chart_path}
+        if chart_type == "scatter" and not y_column:
+            return {"error": "Scatter plot requires both x and y columns"}
+        options = resolve_preset(preset)
+
+        # 智能优化图表文件名，扩展名与输出格式一致
+        extension = f".{options['format']}"
+        save_name = os.path.splitext(save_name)[0] if save_name.endswith(('.png', '.svg')) else save_name
+        save_name = f"{save_name}{extension}"
+        # 添加图表类型前缀，让文件名更有意义
+        if not save_name.startswith(('chart_', 'plot_', 'graph_')):
+            save_name = f"chart_{chart_type}_{save_name}"
+
+        chart_path = os.path.join(task_folder or "output", save_name)
+        full_chart_path = os.path.join(os.getcwd(), chart_path)
+
+        # 在渲染进程池中绘制，多个图表可同时渲染
+        rendered = render(os.path.abspath(file_path), chart_type, x_column, y_column, title, full_chart_path, options["name"])
+
+        result = {"messages": f"Chart saved successfully at {full_chart_path}", "chart_path": chart_path,
+                  "cache_hit": rendered.get("cache_hit", False)}
+        if rendered.get("cache_hit"):
+            result["messages"] += " (reused an identical cached chart)"
+        if rendered.get("aggregation"):
+            result["aggregation"] = rendered["aggregation"]
+        return result
     except Exception as e:
         return {"error": f"Error creating visualization: {str(e)}"}
 
@@ -375,28 +339,39 @@ def trend_analysis(file_path: str, date_column: str, value_column: str, task_fol
     :return: 趋势分析结果
     """
     try:
-        # 读取数据
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
-        # 转换日期格式
-        df[date_column] = pd.to_datetime(df[date_column])
-        df = df.sort_values(date_column)
-        
-        # 计算趋势指标
-        df['year'] = df[date_column].dt.year
-        df['month'] = df[date_column].dt.month
-        df['quarter'] = df[date_column].dt.quarter
-        
-        # 年度趋势
-        yearly_trend = df.groupby('year')[value_column].agg(['sum', 'mean', 'count']).reset_index()
+        import numpy as np
+        import pandas as pd
+        import chunked
+        from dataset import load_dataframe
+        from groupby_engine import groupby_agg
+
+        if chunked.use_chunked(file_path):
+            # 大文件分块累加年月部分结果，季度和年度由月度结果汇总
+            tables = chunked.trend_tables(file_path, date_column, value_column)
+            yearly_trend, monthly_trend, quarterly_trend = tables["yearly"], tables["monthly"], tables["quarterly"]
+            start_date, end_date = tables["start_date"], tables["end_date"]
+        else:
+            # 读取数据（缓存中的DataFrame为共享对象，不在其上添加列）
+            df = load_dataframe(file_path)
+            dates = pd.to_datetime(df[date_column])
+            values = df[value_column]
+
+            # 日期已按时间排序时跳过整表排序，否则只对这两列排序（决定组内的求和顺序）
+            if not dates.is_monotonic_increasing:
+                order = np.argsort(dates.to_numpy(), kind='stable')
+                dates, values = dates.iloc[order], values.iloc[order]
+            valid = dates.notna()
+            if not valid.all():
+                dates, values = dates[valid], values[valid]
+
+            # 只在最细粒度（年月）上做一次分组聚合，季度和年度由月度结果汇总
+            periods = pd.DataFrame({"period": dates.dt.year * 100 + dates.dt.month, "value": values})
+            monthly = groupby_agg(periods, 'period', 'value', ['sum', 'count']).set_index('period')
+            tables = chunked.trend_rollups(monthly, pd.api.types.is_integer_dtype(values.dtype))
+            yearly_trend, monthly_trend, quarterly_trend = tables["yearly"], tables["monthly"], tables["quarterly"]
+            start_date, end_date = dates.iloc[0], dates.iloc[-1]
         yearly_growth = yearly_trend['sum'].pct_change() * 100
         
-        # 月度趋势
-        monthly_trend = df.groupby(['year', 'month'])[value_column].agg(['sum', 'mean', 'count']).reset_index()
-        
-        # 季度趋势
-        quarterly_trend = df.groupby(['year', 'quarter'])[value_column].agg(['sum', 'mean', 'count']).reset_index()
-        
         # 计算总体增长率
         first_value = yearly_trend['sum'].iloc[0]
         last_value = yearly_trend['sum'].iloc[-1]
@@ -410,13 +385,14 @@ def trend_analysis(file_path: str, date_column: str, value_column: str, task_fol
             "monthly_summary": monthly_trend.to_dict('records'),
             "quarterly_summary": quarterly_trend.to_dict('records'),
             "analysis_period": {
-                "start_date": df[date_column].min().strftime('%Y-%m-%d'),
-                "end_date": df[date_column].max().strftime('%Y-%m-%d'),
-                "total_years": df['year'].nunique()
+                "start_date": start_date.strftime('%Y-%m-%d'),
+                "end_date": end_date.strftime('%Y-%m-%d'),
+                "total_years": len(yearly_trend)
             }
         }
         
         # 保存趋势分析结果
+        trend_results = _plain(trend_results)
         if task_folder:
             trend_file_path = os.path.join(task_folder, "trend_analysis_results.json")
             full_trend_path = os.path.join(os.getcwd(), trend_file_path)
@@ -439,13 +415,16 @@ def category_analysis(file_path: str, category_column: str, value_column: str, t
     :return: 分类分析结果
     """
     try:
-        # 读取数据
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
-        # 按分类汇总
-        category_summary = df.groupby(category_column)[value_column].agg([
-            'sum', 'mean', 'count', 'std', 'min', 'max'
-        ]).reset_index()
+        import artifacts
+        import chunked
+
+        # 按分类汇总（记忆化结果为共享对象，复制后再添加列；大文件分块累加分组部分结果）
+        if chunked.use_chunked(file_path):
+            category_summary = chunked.category_summary(file_path, category_column, value_column)
+        else:
+            category_summary = artifacts.groupby_agg(file_path, category_column, value_column, (
+                'sum', 'mean', 'count', 'std', 'min', 'max'
+            )).copy()
         
         # 计算占比
         total_sum = category_summary['sum'].sum()
@@ -470,6 +449,7 @@ def category_analysis(file_path: str, category_column: str, value_column: str, t
         }
         
         # 保存分类分析结果
+        performance_analysis = _plain(performance_analysis)
         if task_folder:
             category_file_path = os.path.join(task_folder, "category_analysis_results.json")
             full_category_path = os.path.join(os.getcwd(), category_file_path)
@@ -490,18 +470,14 @@ def correlation_analysis(file_path: str, task_folder: str = "") -> dict:
     :return: 相关性分析结果
     """
     try:
-        # 读取数据
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
-        # 选择数值型列
-        numerical_df = df.select_dtypes(include=[np.number])
+        import artifacts
+
+        # 数值型列的相关性矩阵（与data_statistics_analysis、heatmap图表共用同一份结果）
+        correlation_matrix = artifacts.correlation_matrix(file_path)
         
-        if numerical_df.empty:
+        if correlation_matrix.empty:
             return {"error": "No numerical columns found for correlation analysis"}
         
-        # 计算相关性矩阵
-        correlation_matrix = numerical_df.corr()
-        
         # 找出强相关关系 (|r| > 0.5)
         strong_correlations = []
         for i in range(len(correlation_matrix.columns)):
@@ -521,9 +497,9 @@ def correlation_analysis(file_path: str, task_folder: str = "") -> dict:
         correlation_results = {
             "correlation_matrix": correlation_matrix.to_dict(),
             "strong_correlations": strong_correlations,
-            "numerical_columns": numerical_df.columns.tolist(),
+            "numerical_columns": correlation_matrix.columns.tolist(),
             "analysis_summary": {
-                "total_variables": len(numerical_df.columns),
+                "total_variables": len(correlation_matrix.columns),
                 "strong_correlations_count": len(strong_correlations),
                 "max_correlation": correlation_matrix.abs().max().max(),
                 "mean_correlation": correlation_matrix.abs().mean().mean()
@@ -531,6 +507,7 @@ def correlation_analysis(file_path: str, task_folder: str = "") -> dict:
         }
         
         # 保存相关性分析结果
+        correlation_results = _plain(correlation_results)
         if task_folder:
             corr_file_path = os.path.join(task_folder, "correlation_analysis_results.json")
             full_corr_path = os.path.join(os.getcwd(), corr_file_path)
@@ -542,69 +519,85 @@ def correlation_analysis(file_path: str, task_folder: str = "") -> dict:
         return {"error": f"Error in correlation analysis: {str(e)}"}
 
 
+def _outlier_summary(df, column_name: str, method: str) -> dict:
+    """整表加载时的异常值检测"""
+    import numpy as np
+
+    data = df[column_name].dropna()
+    outliers_info = {}
+    
+    # IQR方法
+    if method in ["iqr", "both"]:
+        Q1 = data.quantile(0.25)
+        Q3 = data.quantile(0.75)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - 1.5 * IQR
+        upper_bound = Q3 + 1.5 * IQR
+        
+        iqr_outliers = data[(data < lower_bound) | (data > upper_bound)]
+        outliers_info["iqr_method"] = {
+            "lower_bound": lower_bound,
+            "upper_bound": upper_bound,
+            "outliers_count": len(iqr_outliers),
+            "outliers_percentage": (len(iqr_outliers) / len(data)) * 100,
+            "outlier_values": iqr_outliers.tolist()
+        }
+    
+    # Z-Score方法
+    if method in ["zscore", "both"]:
+        z_scores = np.abs((data - data.mean()) / data.std())
+        zscore_outliers = data[z_scores > 3]
+        outliers_info["zscore_method"] = {
+            "threshold": 3,
+            "outliers_count": len(zscore_outliers),
+            "outliers_percentage": (len(zscore_outliers) / len(data)) * 100,
+            "outlier_values": zscore_outliers.tolist()
+        }
+    
+    # 综合分析
+    return {
+        "column_analyzed": column_name,
+        "total_values": len(data),
+        "data_statistics": {
+            "mean": data.mean(),
+            "median": data.median(),
+            "std": data.std(),
+            "min": data.min(),
+            "max": data.max()
+        },
+        "outlier_detection_results": outliers_info
+    }
+
+
 @tool
-def outlier_detection(file_path: str, column_name: str, method: str = "iqr", task_folder: str = "") -> dict:
+def outlier_detection(file_path: str, column_name: str, method: str = "iqr", task_folder: str = "",
+                      approximate: bool = False) -> dict:
     """
     检测异常值
     :param file_path: 数据文件路径
     :param column_name: 要检测的列名
     :param method: 检测方法 ("iqr", "zscore", "both")
     :param task_folder: 任务文件夹路径
+    :param approximate: 是否使用近似模式（四分位数在样本上计算，结果附秩误差界）
     :return: 异常值检测结果
     """
     try:
-        # 读取数据
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
-        if column_name not in df.columns:
+        import approx
+        import chunked
+        from dataset import load_dataframe, dataset_columns
+
+        if column_name not in dataset_columns(file_path):
             return {"error": f"Column '{column_name}' not found in data"}
-        
-        data = df[column_name].dropna()
-        outliers_info = {}
-        
-        # IQR方法
-        if method in ["iqr", "both"]:
-            Q1 = data.quantile(0.25)
-            Q3 = data.quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            
-            iqr_outliers = data[(data < lower_bound) | (data > upper_bound)]
-            outliers_info["iqr_method"] = {
-                "lower_bound": lower_bound,
-                "upper_bound": upper_bound,
-                "outliers_count": len(iqr_outliers),
-                "outliers_percentage": (len(iqr_outliers) / len(data)) * 100,
-                "outlier_values": iqr_outliers.tolist()
-            }
-        
-        # Z-Score方法
-        if method in ["zscore", "both"]:
-            z_scores = np.abs((data - data.mean()) / data.std())
-            zscore_outliers = data[z_scores > 3]
-            outliers_info["zscore_method"] = {
-                "threshold": 3,
-                "outliers_count": len(zscore_outliers),
-                "outliers_percentage": (len(zscore_outliers) / len(data)) * 100,
-                "outlier_values": zscore_outliers.tolist()
-            }
-        
-        # 综合分析
-        analysis_summary = {
-            "column_analyzed": column_name,
-            "total_values": len(data),
-            "data_statistics": {
-                "mean": data.mean(),
-                "median": data.median(),
-                "std": data.std(),
-                "min": data.min(),
-                "max": data.max()
-            },
-            "outlier_detection_results": outliers_info
-        }
+        if chunked.use_chunked(file_path):
+            # 大文件分两遍流式扫描：先得到统计量和近似四分位数，再统计异常值
+            analysis_summary = chunked.outlier_summary(file_path, column_name, method)
+        elif approx.use_approximate(approximate):
+            analysis_summary = approx.outlier_summary(load_dataframe(file_path), column_name, method)
+        else:
+            analysis_summary = _outlier_summary(load_dataframe(file_path), column_name, method)
         
         # 保存异常值检测结果
+        analysis_summary = _plain(analysis_summary)
         if task_folder:
             outlier_file_path = os.path.join(task_folder, f"outlier_detection_{column_name}.json")
             full_outlier_path = os.path.join(os.getcwd(), outlier_file_path)
@@ -616,6 +609,129 @@ def outlier_detection(file_path: str, column_name: str, method: str = "iqr", tas
         return {"error": f"Error in outlier detection: {str(e)}"}
 
 
+# sql_query单次返回的最大行数上限
+SQL_QUERY_MAX_ROWS = int(os.getenv("SQL_QUERY_MAX_ROWS", "1000"))
+# 只允许只读查询（SELECT/WITH/FROM/DESCRIBE/SUMMARIZE/SHOW都属于SELECT类），sql_query可以与其他只读工具并发执行
+_SQL_ALLOWED_STATEMENTS = ("SELECT", "EXPLAIN")
+
+
+def _sql_view_name(file_path: str, used: set) -> str:
+    """文件名转为视图名：小写，非字母数字字符替换为下划线，重名时追加序号"""
+    base = re.sub(r'[^0-9a-z]+', '_', os.path.splitext(os.path.basename(file_path))[0].lower()).strip('_') or "data"
+    if base[0].isdigit():
+        base = f"t_{base}"
+    name, index = base, 2
+    while name in used:
+        name, index = f"{base}_{index}", index + 1
+    return name
+
+
+def _sql_tables(file_paths, task_folder: str) -> dict:
+    """视图名 -> CSV路径：传入的文件在前，第一个文件另有别名data，其后是任务文件夹中的CSV"""
+    import glob
+
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+    paths = list(file_paths or [])
+    if task_folder:
+        paths += sorted(glob.glob(os.path.join(task_folder, "*.csv")))
+    tables, seen = {}, set()
+    for path in paths:
+        if os.path.abspath(path) in seen:
+            continue
+        seen.add(os.path.abspath(path))
+        tables[_sql_view_name(path, set(tables) | {"data"})] = path
+    return tables
+
+
+def _sql_register(con, name: str, file_path: str):
+    """复用数据集缓存中已解析的DataFrame（与其他工具的列类型一致）；超过分块阈值的大文件由DuckDB直接流式读取CSV"""
+    import chunked
+    from dataset import load_dataframe
+
+    if chunked.use_chunked(file_path):
+        con.read_csv(file_path).create_view(name)
+    else:
+        con.register(name, load_dataframe(file_path))
+
+
+def _sql_value(value):
+    """查询结果中的值转为可JSON序列化的类型"""
+    from datetime import date, time, timedelta
+    from decimal import Decimal
+
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return value
+
+
+@tool
+def sql_query(query: str, file_paths: Union[List[str], str] = None, max_rows: int = 100, task_folder: str = "") -> dict:
+    """
+    用SQL查询CSV数据集（在进程内的DuckDB中向量化执行，需安装duckdb），适合任意的分组、筛选、排序、窗口函数等临时聚合，
+    无需编写脚本再用shell_exec执行。每个CSV注册为一个视图，视图名为文件名（小写，非字母数字字符替换为下划线，
+    如china_automobile_sales_data），第一个文件也可以用data引用；任务文件夹中的CSV（如data_export导出的结果）同样可以查询。
+    只允许只读查询（SELECT、WITH、DESCRIBE、SUMMARIZE等）
+    :param query: SQL语句，如SELECT brand, SUM(units_sold) AS total FROM data GROUP BY brand ORDER BY total DESC
+    :param file_paths: 要查询的CSV文件路径，单个路径或路径列表
+    :param max_rows: 最多返回的行数
+    :param task_folder: 任务文件夹路径
+    :return: 查询结果，包括columns（列名和类型）、rows（每行一个记录）、row_count、truncated（是否还有更多行）以及可用的视图
+    """
+    try:
+        try:
+            import duckdb
+        except ImportError:
+            return {"error": "sql_query requires duckdb, install it with: pip install duckdb"}
+
+        tables = _sql_tables(file_paths, task_folder)
+        if not tables:
+            return {"error": "No CSV files to query, pass file_paths"}
+        max_rows = max(1, min(int(max_rows), SQL_QUERY_MAX_ROWS))
+
+        with duckdb.connect() as con:
+            try:
+                statements = con.extract_statements(query)
+            except duckdb.Error as e:
+                return {"error": f"SQL error: {str(e)}", "tables": tables}
+            if len(statements) != 1:
+                return {"error": "sql_query runs exactly one SQL statement"}
+            if statements[0].type.name not in _SQL_ALLOWED_STATEMENTS:
+                return {"error": f"Only read-only queries are allowed, got {statements[0].type.name}"}
+            for name, path in tables.items():
+                _sql_register(con, name, path)
+            con.execute(f'CREATE VIEW data AS SELECT * FROM "{next(iter(tables))}"')
+
+            try:
+                relation = con.sql(query)
+                # 多取一行判断结果是否被截断，LIMIT下推后无需物化完整结果
+                rows = relation.limit(max_rows + 1).fetchall()
+            except duckdb.Error as e:
+                return {"error": f"SQL error: {str(e)}", "tables": tables}
+            # ENUM（来自category列）的类型名包含全部取值，只保留类型名
+            columns = [{"name": name, "type": "ENUM" if column_type.id == "enum" else str(column_type)}
+                       for name, column_type in zip(relation.columns, relation.types)]
+
+        truncated = len(rows) > max_rows
+        records = [{column["name"]: _sql_value(value) for column, value in zip(columns, row)} for row in rows[:max_rows]]
+        return {
+            "messages": f"Query returned {len(records)} rows" + (f" (truncated to max_rows={max_rows})" if truncated else ""),
+            "columns": columns,
+            "rows": records,
+            "row_count": len(records),
+            "truncated": truncated,
+            "tables": tables
+        }
+    except Exception as e:
+        return {"error": f"Error in SQL query: {str(e)}"}
+
+
 @tool
 def data_export(data_dict: Union[dict, str], file_name: str, export_format: str = "json", task_folder: str = "") -> dict:
     """
@@ -627,6 +743,8 @@ def data_export(data_dict: Union[dict, str], file_name: str, export_format: str
     :return: 导出结果
     """
     try:
+        import pandas as pd
+
         # 如果输入是字符串，尝试解析为字典
         if isinstance(data_dict, str):
             try:
@@ -731,3 +849,9 @@ def list_files(directory_path: str = "output") -> dict:
         return {"error": f"Error listing files: {str(e)}"}
 
 
+# 工具注册表：按名称查找工具（基准测试等按名称调用工具的场景）
+TOOL_REGISTRY = {t.name: t for t in [
+    create_task_folder, create_file, str_replace, send_messages, shell_exec, read_csv_data,
+    data_statistics_analysis, create_visualization, trend_analysis, category_analysis,
+    correlation_analysis, outlier_detection, sql_query, data_export, read_file_content, list_files
+]}
@@ -0,0 +1,197 @@
+# !/usr/bin/env python
+# -*-coding:utf-8 -*-
+# File       : tracing.py
+# Time       ：2025/7/16 10:47
+# Author     ：aigonna
+"""
+结构化耗时追踪：记录每次节点执行、LLM调用和工具调用的span
+
+    - 节点span：节点名、步骤id、耗时
+    - LLM span：延迟、输入/输出token数、是否命中缓存
+    - 工具span：墙钟时间、CPU时间（工作线程的thread_time）、处理的数据行数、结果和输出文件字节数
+
+节点把本次产生的span放到State的trace字段（operator.add累加），report节点结束时调用export_trace，
+默认导出器把全部span以OpenTelemetry OTLP/JSON格式写入task_folder/trace.json。
+可通过register_exporter注册其他导出器（例如发送到OTel Collector）。
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import contextvars
+import contextlib
+from loguru import logger
+
+TRACE_FILE_NAME = "trace.json"
+SERVICE_NAME = "langgraph_auto_report"
+
+# 当前节点的span收集器，LLM和工具span挂在所属节点下
+_current_node = contextvars.ContextVar("current_trace_node", default=None)
+_exporters = []
+
+
+class NodeTrace:
+    """一次节点执行的span收集器"""
+
+    def __init__(self, name: str, task_folder: str = "", **attributes):
+        self.name = name
+        self.trace_id = trace_id_for(task_folder)
+        self.span_id = _new_span_id()
+        self.attributes = attributes
+        self.spans = []
+
+    def add(self, name: str, kind: str, start_ns: int, end_ns: int, **attributes):
+        self.spans.append(_span(self.trace_id, self.span_id, _new_span_id(), name, kind, start_ns, end_ns, attributes))
+
+
+def _new_span_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def trace_id_for(task_folder: str) -> str:
+    """同一次报告任务的所有span共享trace id，由任务文件夹派生"""
+    return hashlib.md5((task_folder or "").encode("utf-8")).hexdigest()
+
+
+def _span(trace_id: str, parent_id: str, span_id: str, name: str, kind: str,
+          start_ns: int, end_ns: int, attributes: dict) -> dict:
+    return {"trace_id": trace_id, "span_id": span_id, "parent_span_id": parent_id, "name": name, "kind": kind,
+            "start_ns": start_ns, "end_ns": end_ns, "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+            "attributes": {k: v for k, v in attributes.items() if v is not None}}
+
+
+@contextlib.contextmanager
+def node_span(name: str, task_folder: str = "", **attributes):
+    """
+    追踪一次节点执行，期间的LLM/工具span都归属于该节点
+    with块结束后trace.spans包含子span和节点span本身，由节点放入State的trace字段；
+    节点可以在执行中向trace.attributes补充属性
+    """
+    trace = NodeTrace(name, task_folder, **attributes)
+    token = _current_node.set(trace)
+    start_ns = time.time_ns()
+    try:
+        yield trace
+    finally:
+        _current_node.reset(token)
+        end_ns = time.time_ns()
+        children = list(trace.spans)
+        for kind in ("llm", "tool"):
+            trace.attributes[f"{kind}_calls"] = sum(1 for span in children if span["kind"] == kind)
+            trace.attributes[f"{kind}_ms"] = round(sum(span["duration_ms"] for span in children if span["kind"] == kind), 3)
+        trace.spans.append(_span(trace.trace_id, None, trace.span_id, name, "node", start_ns, end_ns, trace.attributes))
+
+
+def add_span(name: str, kind: str, start_ns: int, end_ns: int, **attributes):
+    """把span挂到当前节点下；不在节点上下文中时忽略"""
+    trace = _current_node.get()
+    if trace is not None:
+        trace.add(name, kind, start_ns, end_ns, **attributes)
+
+
+def token_usage(response: dict) -> dict:
+    """从model_dump后的响应中取出token用量，兼容usage_metadata和LiteLLM的response_metadata.token_usage"""
+    usage = response.get("usage_metadata") or {}
+    if usage:
+        return {"prompt_tokens": usage.get("input_tokens"), "completion_tokens": usage.get("output_tokens")}
+    usage = (response.get("response_metadata") or {}).get("token_usage") or {}
+    return {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+
+
+def _output_bytes(result) -> tuple:
+    """工具结果序列化后的字节数，以及结果中引用的输出文件的字节数"""
+    result_bytes = len(str(result).encode("utf-8"))
+    file_bytes = 0
+    if isinstance(result, dict):
+        for key, value in result.items():
+            if key.endswith("path") and isinstance(value, str) and os.path.isfile(value):
+                file_bytes += os.path.getsize(value)
+    return result_bytes, file_bytes
+
+
+def measured_call(func, *args):
+    """
+    在工作线程/子进程中执行工具并测量资源使用，返回(结果, 指标)
+    func需可被pickle（进程池中执行时）
+    """
+    dataset = sys.modules.get("dataset")
+    if dataset is not None:
+        dataset.reset_rows_processed()
+    start_ns = time.time_ns()
+    cpu_started = time.thread_time()
+    result = func(*args)
+    cpu_seconds = time.thread_time() - cpu_started
+    end_ns = time.time_ns()
+    # 工具可能在本次调用中才首次导入dataset
+    dataset = sys.modules.get("dataset")
+    result_bytes, file_bytes = _output_bytes(result)
+    return result, {"start_ns": start_ns, "end_ns": end_ns, "cpu_ms": round(cpu_seconds * 1000, 3),
+                    "rows": dataset.rows_processed() if dataset is not None else 0,
+                    "result_bytes": result_bytes, "output_file_bytes": file_bytes, "pid": os.getpid()}
+
+
+def register_exporter(exporter):
+    """注册导出器，签名为exporter(spans: list, task_folder: str)，在报告完成时调用"""
+    _exporters.append(exporter)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_OTLP_KIND = {"node": 1, "tool": 1, "llm": 3}  # SPAN_KIND_INTERNAL / SPAN_KIND_CLIENT
+
+
+def to_otlp_json(spans: list) -> dict:
+    """转换为OpenTelemetry OTLP/JSON（ExportTraceServiceRequest）格式"""
+    otlp_spans = []
+    for span in spans:
+        attributes = dict(span["attributes"], **{"span.kind": span["kind"], "duration_ms": span["duration_ms"]})
+        otlp_span = {"traceId": span["trace_id"], "spanId": span["span_id"], "name": span["name"],
+                     "kind": _OTLP_KIND.get(span["kind"], 1),
+                     "startTimeUnixNano": str(span["start_ns"]), "endTimeUnixNano": str(span["end_ns"]),
+                     "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()]}
+        if span["parent_span_id"]:
+            otlp_span["parentSpanId"] = span["parent_span_id"]
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": otlp_spans}]}]}
+
+
+def write_trace_json(spans: list, task_folder: str):
+    """默认导出器：写入task_folder/trace.json"""
+    if not task_folder:
+        return
+    os.makedirs(task_folder, exist_ok=True)
+    path = os.path.join(task_folder, TRACE_FILE_NAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(to_otlp_json(spans), f, ensure_ascii=False, indent=2)
+    logger.info(f"⏱️ 追踪数据已写入 {path}")
+
+
+def summarize(spans: list) -> dict:
+    """按span类型和名称汇总总耗时，便于日志中快速查看时间花在哪里"""
+    summary = {}
+    for span in spans:
+        item = summary.setdefault(f"{span['kind']}:{span['name']}", {"count": 0, "total_ms": 0.0})
+        item["count"] += 1
+        item["total_ms"] = round(item["total_ms"] + span["duration_ms"], 3)
+    return dict(sorted(summary.items(), key=lambda kv: -kv[1]["total_ms"]))
+
+
+def export_trace(spans: list, task_folder: str):
+    """调用默认导出器和所有已注册的导出器，导出失败不影响报告结果"""
+    for exporter in [write_trace_json] + _exporters:
+        try:
+            exporter(spans, task_folder)
+        except Exception as e:
+            logger.warning(f"⚠️ 追踪数据导出失败({getattr(exporter, '__name__', exporter)}): {e}")